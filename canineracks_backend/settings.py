@@ -72,6 +72,52 @@ DATABASES = {
     )
 }
 
+# Caches
+# LocMemCache is per process and evicts least recently used entries once
+# MAX_ENTRIES is reached; point these at a shared backend (Redis/Memcached)
+# to share entries and invalidations across gunicorn workers.
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+RECOMMENDATION_CACHE_BACKEND = config('RECOMMENDATION_CACHE_BACKEND', default=LOCMEM_CACHE)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # User -> profile signature and its hit/miss counters (inventory.recommendations);
+    # must be shared when running several workers, or profile edits are missed elsewhere
+    'recommendations': {
+        'BACKEND': RECOMMENDATION_CACHE_BACKEND,
+        'LOCATION': config('RECOMMENDATION_CACHE_LOCATION', default='recommendations'),
+        'TIMEOUT': config('RECOMMENDATION_CACHE_TTL', default=600, cast=int),
+        # An in-process cache needs a bound; shared backends evict by their own policy
+        'OPTIONS': {
+            'MAX_ENTRIES': config('RECOMMENDATION_CACHE_MAX_ENTRIES', default=2000, cast=int),
+        } if RECOMMENDATION_CACHE_BACKEND == LOCMEM_CACHE else {},
+    },
+    # Cross-worker state: the catalog and typeahead generations and the facet
+    # counts. Point it at a shared backend (e.g. Redis) when running several workers
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default='shared'),
+    },
+    # Token buckets (users.throttling); must be shared when running several workers
+    'throttle': {
+        'BACKEND': config('THROTTLE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('THROTTLE_CACHE_LOCATION', default='throttle'),
+    },
+    # Verification codes (users.otp); must be shared when running several workers
+    'otp': {
+        'BACKEND': config('OTP_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('OTP_CACHE_LOCATION', default='otp'),
+    },
+}
+
+# Verification codes: lifetime in seconds, checks allowed per code, and whether
+# codes are also kept in the EmailVerification table to survive cache loss
+OTP_TTL = config('OTP_TTL', default=600, cast=int)
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', default=5, cast=int)
+OTP_DB_FALLBACK = config('OTP_DB_FALLBACK', default=False, cast=bool)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,21 +149,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.VersionedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'EXCEPTION_HANDLER': 'inventory.views.custom_exception_handler',
+    # Proxies in front of the app (Render's load balancer). Throttles key on the
+    # X-Forwarded-For entry they appended, not on whatever the client sent
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
+    # Token buckets for the public auth endpoints (users.throttling)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': config('THROTTLE_LOGIN_IP', default='30/min'),
+        'login_email': config('THROTTLE_LOGIN_EMAIL', default='5/min'),
+        'send_code_ip': config('THROTTLE_SEND_CODE_IP', default='10/min'),
+        'send_code_email': config('THROTTLE_SEND_CODE_EMAIL', default='3/min'),
+        'verify_code_ip': config('THROTTLE_VERIFY_CODE_IP', default='30/min'),
+        'verify_code_email': config('THROTTLE_VERIFY_CODE_EMAIL', default='10/min'),
+    },
 }
 
+# Upper bound for ?page_size= on cursor-paginated lists
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=200, cast=int)
+
+# Products at or below this quantity match ?low_stock=true
+LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', default=5, cast=int)
+
+# Deleted-product tombstones are kept this long; older sync tokens need a full resync
+TOMBSTONE_RETENTION_DAYS = config('TOMBSTONE_RETENTION_DAYS', default=30, cast=int)
+
+# Rows validated and inserted per transaction by the bulk product import
+PRODUCT_IMPORT_CHUNK_SIZE = config('PRODUCT_IMPORT_CHUNK_SIZE', default=500, cast=int)
+# Largest chunk_size an upload may ask for; a chunk is held in memory and in one transaction
+PRODUCT_IMPORT_MAX_CHUNK_SIZE = config('PRODUCT_IMPORT_MAX_CHUNK_SIZE', default=5000, cast=int)
+
 # SimpleJWT Configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.authentication.VersionedTokenRefreshSerializer',
 }
 
+# How long a process trusts a user's token_version before re-reading it, i.e.
+# how long a revoked token can still pass ClaimsJWTAuthentication elsewhere
+TOKEN_VERSION_CACHE_SECONDS = config('TOKEN_VERSION_CACHE_SECONDS', default=30, cast=int)
+
+# /api/batch/: sub-requests per batch, seconds after which no further
+# sub-request of a batch starts, and threads in the process-wide pool for
+# concurrent read-only sub-requests (1 runs everything in order)
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+BATCH_TIME_LIMIT = config('BATCH_TIME_LIMIT', default=10, cast=float)
+BATCH_MAX_WORKERS = config('BATCH_MAX_WORKERS', default=4, cast=int)
+
 # Djoser Configuration
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -133,8 +218,8 @@ DJOSER = {
     },
 }
 
+# A single backend: a second one would hash the password again on every failed login
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'users.backends.EmailBackend',
 ]
 
@@ -172,6 +257,12 @@ EMAIL_HOST_PASSWORD = 'chhn ymjj kwwq gtng'
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = 'CanineRacks <canineracks@gmail.com>'
 
+# Outbox worker (manage.py send_outbox): messages per batch, tries per message
+# and the first retry delay, doubled after every failure
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=50, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+OUTBOX_RETRY_DELAY = config('OUTBOX_RETRY_DELAY', default=30, cast=int)
+
 # ✅ CLOUDINARY STORAGE
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
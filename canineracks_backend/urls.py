@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from inventory.batch import BatchView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -12,6 +14,9 @@ urlpatterns = [
     # Inventory app
     path('api/inventory/', include('inventory.urls')),
 
+    # Several API calls in one round-trip
+    path('api/batch/', BatchView.as_view(), name='batch'),
+
     # Authentication endpoints from djoser (optional)
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
@@ -0,0 +1,220 @@
+"""POST /api/batch/: several API calls in one round-trip.
+
+The body is {"requests": [{"method", "path", "body"?}, ...], "concurrent"?}.
+Each sub-request is resolved against the URL conf and its view is called
+in-process, without another pass through the middleware. Authentication is
+shared: the batch's own bearer token is checked once, and every distinct
+set of authentication classes among the target views runs at most once;
+sub-requests then reuse that user. Bodies are sent as JSON, or form-encoded
+when the target view only parses forms.
+
+Sub-requests run in order. With "concurrent": true, consecutive read-only
+sub-requests (GET/HEAD/OPTIONS) run on one pool of BATCH_MAX_WORKERS threads
+shared by every batch in the process; writes still run one by one, and after
+the reads before them. A batch holds at most BATCH_MAX_REQUESTS sub-requests.
+BATCH_TIME_LIMIT is a start deadline: a sub-request that has not started
+within that many seconds of the batch is answered with a 504, while one
+that has started runs to completion.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import unquote, urlencode, urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.authentication import ClaimsJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Request headers that describe the batch itself, not its sub-requests
+PARENT_ONLY_HEADERS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH',
+                       'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool for concurrent sub-requests, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS, thread_name_prefix='batch')
+        return _executor
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=READ_METHODS + WRITE_METHODS)
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError("Only /api/ paths can be batched.")
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    concurrent = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f"A batch holds at most {settings.BATCH_MAX_REQUESTS} requests.")
+        return value
+
+
+def error_result(status_code, detail):
+    return {'status': status_code, 'headers': {}, 'body': {'detail': detail}}
+
+
+def describe_response(response):
+    """{'status', 'headers', 'body'} for a sub-request's response; JSON bodies are decoded."""
+    if getattr(response, 'streaming', False):
+        response.close()
+        return error_result(status.HTTP_501_NOT_IMPLEMENTED, "Streaming responses cannot be batched.")
+    if hasattr(response, 'render'):
+        response.render()
+    headers = {name: value for name, value in response.items() if name.lower() != 'content-length'}
+    content = response.content
+    if not content:
+        body = None
+    elif response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(content)
+    else:
+        body = content.decode(response.charset, errors='replace')
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def accepts_json(match, method):
+    """True if the resolved view (or viewset action) parses JSON bodies for ``method``."""
+    view_class = match.func.cls
+    parser_classes = view_class.parser_classes
+    actions = getattr(match.func, 'actions', None) or {}
+    handler = getattr(view_class, actions.get(method.lower(), ''), None)
+    parser_classes = getattr(handler, 'kwargs', {}).get('parser_classes', parser_classes)
+    return any(parser.media_type == 'application/json' for parser in parser_classes)
+
+
+class Dispatcher:
+    """Runs the sub-requests of one batch on behalf of its (already authenticated) request."""
+
+    def __init__(self, request, deadline):
+        self.request = request
+        self.deadline = deadline
+        # authentication classes -> (user, token) or None; the batch's own is known already
+        self.authentications = {tuple(BatchView.authentication_classes): (request.user, request.auth)}
+
+    def run(self, subrequest):
+        if time.monotonic() >= self.deadline:
+            return error_result(status.HTTP_504_GATEWAY_TIMEOUT, "Batch time limit exceeded.")
+        url = urlsplit(subrequest['path'])
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return error_result(status.HTTP_404_NOT_FOUND, "Not found.")
+        view_class = getattr(match.func, 'cls', None)
+        if view_class is None or issubclass(view_class, BatchView):
+            return error_result(status.HTTP_400_BAD_REQUEST, "This path cannot be batched.")
+
+        http_request = self.build_request(subrequest, url, match)
+        authentication = self.authenticate(view_class)
+        if authentication is not None:
+            # Honoured by rest_framework.request.Request in place of the view's authenticators
+            http_request._force_auth_user, http_request._force_auth_token = authentication
+        try:
+            return describe_response(match.func(http_request, *match.args, **match.kwargs))
+        except Exception:
+            logger.exception("Batched %s %s failed", subrequest['method'], subrequest['path'])
+            return error_result(status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal server error.")
+
+    def run_in_thread(self, subrequest):
+        try:
+            return self.run(subrequest)
+        finally:
+            connection.close()  # the worker thread's own connection
+
+    def build_request(self, subrequest, url, match):
+        body, content_type = b'', 'application/json'
+        if 'body' in subrequest:
+            data = subrequest['body']
+            if isinstance(data, dict) and not accepts_json(match, subrequest['method']):
+                body, content_type = urlencode(data, doseq=True).encode(), 'application/x-www-form-urlencoded'
+            else:
+                body = json.dumps(data).encode()
+
+        environ = {key: value for key, value in self.request.META.items() if key not in PARENT_ONLY_HEADERS}
+        environ.update({
+            'REQUEST_METHOD': subrequest['method'],
+            'PATH_INFO': unquote(url.path).encode().decode('iso-8859-1'),  # WSGI's byte-string convention
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        })
+        http_request = WSGIRequest(environ)
+        http_request.resolver_match = match
+        return http_request
+
+    def authenticate(self, view_class):
+        """The shared (user, token) for the view's authentication classes, or None for anonymous."""
+        classes = tuple(view_class.authentication_classes)
+        if classes not in self.authentications:
+            result = None
+            for authentication_class in classes:
+                try:
+                    result = authentication_class().authenticate(self.request)
+                except Exception:
+                    result = None  # the view authenticates itself and reports the failure
+                    break
+                if result is not None:
+                    break
+            # A race between worker threads only costs a duplicate lookup
+            self.authentications[classes] = result
+        return self.authentications[classes]
+
+
+class BatchView(APIView):
+    """Dispatches a list of API requests in-process and returns all their responses together."""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        subrequests = serializer.validated_data['requests']
+        concurrent = serializer.validated_data['concurrent'] and settings.BATCH_MAX_WORKERS > 1
+
+        dispatcher = Dispatcher(request, time.monotonic() + settings.BATCH_TIME_LIMIT)
+        results = []
+        while len(results) < len(subrequests):
+            reads = []
+            if concurrent:
+                for subrequest in subrequests[len(results):]:
+                    if subrequest['method'] not in READ_METHODS:
+                        break
+                    reads.append(subrequest)
+            if len(reads) > 1:
+                results.extend(self.run_concurrently(dispatcher, reads))
+            else:
+                results.append(dispatcher.run(subrequests[len(results)]))
+        return Response({'responses': results})
+
+    def run_concurrently(self, dispatcher, subrequests):
+        # Reads queued behind other batches until the deadline get their 504 from run()
+        futures = [get_executor().submit(dispatcher.run_in_thread, subrequest) for subrequest in subrequests]
+        return [future.result() for future in futures]
@@ -0,0 +1,182 @@
+"""Parsing of Product.product_code and DogProfile values into code bitmasks.
+
+A product code has five dash-separated segments, e.g. ``PU-BS-CT-LS-NO``:
+life stage, size, coat, role and health. Each segment is compiled once, when
+the product is saved, into a bitmask over ``CODES`` with the ``ALL_EQUIV``
+wildcards already expanded, so matching a dog profile is a bitwise test.
+
+Dog profiles are compiled the same way when saved: one bitmask per dimension
+under the same field names, 0 meaning unspecified. Writes through the API
+are validated with clean_profile_value(), so only known values get stored.
+"""
+
+# ==========================
+# Profile value -> short code
+# ==========================
+
+PROFILE_MAP = {
+    "PUPPY": "PU",
+    "ADULT": "AD",
+    "SENIOR": "SE",
+    "SMALL": "SM",
+    "MEDIUM": "ME",
+    "LARGE": "LA",
+    "GIANT": "GI",
+    "SHORT-HAIRED": "SH",
+    "LONG-HAIRED": "LH",
+    "HYPOALLERGENIC": "HY",
+    "WORKING / SERVICE DOGS": "WS",
+    "COMPANION DOGS": "CO",
+    "NONE": "NO",
+    "BRACHYCEPHALIC (SHORT-NOSED)": "BR",
+    "JOINT AND MOBILITY ISSUES": "JM",
+    "ALLERGIES AND SENSITIVITIES": "AS",
+}
+
+# Wildcard segments that stand for every code of a dimension
+ALL_EQUIV = {
+    'PU': ['LI'],
+    'AD': ['LI'],
+    'SE': ['LI'],
+    'SH': ['CT'],
+    'LH': ['CT'],
+    'HY': ['CT'],
+    'WS': ['LS'],
+    'CO': ['LS'],
+    'LS': ['LS'],
+    'NO': ['NOBRJMAS'],
+    'BR': ['NOBRJMAS'],
+    'JM': ['NOBRJMAS'],
+    'AS': ['NOBRJMAS'],
+    'SM': ['BS'],
+    'ME': ['BS'],
+    'LA': ['BS'],
+    'GI': ['BS'],
+}
+
+# Segments that stand for a whole dimension rather than naming codes
+WILDCARD_SEGMENTS = frozenset(alt for alts in ALL_EQUIV.values() for alt in alts)
+
+# Bit positions are stored in the database: only ever append to this tuple.
+CODES = tuple(dict.fromkeys(PROFILE_MAP.values()))
+CODE_BITS = {code: 1 << index for index, code in enumerate(CODES)}
+
+# Product and DogProfile fields holding the compiled segments, in product code order
+CODE_MASK_FIELDS = ('life_stage_mask', 'size_mask', 'coat_mask', 'role_mask', 'health_mask')
+
+# DogProfile field -> the codes it may hold; health_considerations is a comma-separated list
+PROFILE_FIELD_CODES = {
+    'life_stage': ('PU', 'AD', 'SE'),
+    'size': ('SM', 'ME', 'LA', 'GI'),
+    'coat_type': ('SH', 'LH', 'HY'),
+    'role': ('WS', 'CO'),
+    'health_considerations': ('NO', 'BR', 'JM', 'AS'),
+}
+
+
+def matches(value, segment):
+    """Returns True if a profile code is accepted by one product code segment."""
+    if value in segment:
+        return True
+    if segment in ALL_EQUIV.get(value, []):
+        return True
+    if value in ALL_EQUIV:
+        for alt in ALL_EQUIV[value]:
+            if alt in segment:
+                return True
+    return False
+
+
+def split_product_code(product_code):
+    """Returns the five normalized segments of a product code, or None if malformed."""
+    segments = (product_code or '').upper().replace(' ', '').split('-')
+    if len(segments) < 5:
+        return None
+    return segments[:5]
+
+
+def segment_mask(segment):
+    """Bitmask of every code in CODES that the segment accepts."""
+    mask = 0
+    for code in CODES:
+        if matches(code, segment):
+            mask |= CODE_BITS[code]
+    return mask
+
+
+def exact_segment_mask(segment):
+    """Bitmask of the codes spelled out in the segment itself, ignoring wildcards.
+
+    A segment is a run of two-letter codes, e.g. ``JMAS``; a wildcard such as
+    ``NOBRJMAS`` names no code exactly even though it contains them all.
+    """
+    if segment in WILDCARD_SEGMENTS:
+        return 0
+    mask = 0
+    for start in range(0, len(segment), 2):
+        mask |= CODE_BITS.get(segment[start:start + 2], 0)
+    return mask
+
+
+def compile_product_code(product_code):
+    """Returns the five segment bitmasks of a product code, or None if malformed."""
+    segments = split_product_code(product_code)
+    if segments is None:
+        return None
+    return tuple(segment_mask(segment) for segment in segments)
+
+
+def accepts(masks, codes):
+    """Returns True if compiled segment masks accept a profile_codes() tuple."""
+    life_stage, size, coat_type, role, health_codes = codes
+    if masks[-1] is None or not health_codes:
+        return False
+    for mask, value in zip(masks, (life_stage, size, coat_type, role)):
+        if value and not mask & CODE_BITS[value]:
+            return False
+    return "" in health_codes or any(masks[4] & CODE_BITS[code] for code in health_codes)
+
+
+def clean_profile_value(field, value):
+    """Normalizes one DogProfile value; raises ValueError if it is not a known value for the field."""
+    allowed = PROFILE_FIELD_CODES[field]
+    if field == 'health_considerations':
+        parts = [part.strip() for part in value.split(',') if part.strip()]
+    else:
+        parts = [value.strip()]
+    for part in parts:
+        if PROFILE_MAP.get(part.upper()) not in allowed:
+            choices = ', '.join(label for label, code in PROFILE_MAP.items() if code in allowed)
+            raise ValueError(f"Unknown value {part!r}; expected one of {choices} (any case).")
+    return ', '.join(parts)
+
+
+def profile_codes(dog):
+    """Maps a DogProfile's values to (life_stage, size, coat_type, role, health_codes).
+
+    Unknown values map to "" which, like a substring test, accepts any segment.
+    Saved profiles already hold the result in their masks: see stored_profile_codes().
+    """
+    return (
+        PROFILE_MAP.get(dog.life_stage.upper().strip(), ""),
+        PROFILE_MAP.get(dog.size.upper().strip(), ""),
+        PROFILE_MAP.get(dog.coat_type.upper().strip(), ""),
+        PROFILE_MAP.get(dog.role.upper().strip(), ""),
+        [PROFILE_MAP.get(h.strip().upper(), "") for h in dog.health_considerations.split(',') if h.strip()],
+    )
+
+
+def profile_masks(dog):
+    """The CODE_MASK_FIELDS values of a DogProfile; unknown health values are dropped."""
+    *codes, health_codes = profile_codes(dog)
+    health_mask = 0
+    for code in health_codes:
+        health_mask |= CODE_BITS.get(code, 0)
+    return (*(CODE_BITS.get(code, 0) for code in codes), health_mask)
+
+
+def stored_profile_codes(dog):
+    """profile_codes() of a saved DogProfile, read back from its masks."""
+    *masks, health_mask = (getattr(dog, field) for field in CODE_MASK_FIELDS)
+    codes = [next((code for code in CODES if mask & CODE_BITS[code]), "") for mask in masks]
+    return (*codes, [code for code in CODES if health_mask & CODE_BITS[code]])
@@ -0,0 +1,35 @@
+"""Conditional GET support (ETag / Last-Modified) for the product endpoints.
+
+Validators come from one aggregate query, e.g. ``max(updated_at)`` and
+``count(*)`` over the filtered queryset, hashed together with the query
+parameters, so an unchanged resource is answered with 304 before anything
+is fetched or serialized. Last-Modified is only sent where the timestamp
+alone changes with every write; collections that can shrink rely on the ETag.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(request, *parts):
+    """Strong ETag over the validator parts and the request's query parameters."""
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(repr((request.path, params, parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, etag, last_modified):
+    """Returns a 304 response if the client's copy is current, else None."""
+    timestamp = last_modified.timestamp() if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
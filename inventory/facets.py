@@ -0,0 +1,46 @@
+"""Per-category product counts, cached until the next product write.
+
+Counts and their generation live in the 'shared' cache alias, so a write
+handled by one worker invalidates the counts every worker serves.
+"""
+import hashlib
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from django.db.models import Count
+
+FACETS_KEY = 'facets:{generation}:{params}'
+GENERATION_KEY = 'facets:generation'
+FACETS_TIMEOUT = 300
+
+
+def facet_counts(queryset):
+    """Counts per main and sub category from one GROUP BY query."""
+    rows = queryset.order_by().values('main_category', 'sub_category').annotate(count=Count('id'))
+    main_categories, sub_categories = Counter(), Counter()
+    for row in rows:
+        main_categories[row['main_category']] += row['count']
+        sub_categories[row['sub_category']] += row['count']
+    return {
+        'total': sum(main_categories.values()),
+        'main_category': dict(sorted(main_categories.items())),
+        'sub_category': dict(sorted(sub_categories.items())),
+    }
+
+
+def cached_facet_counts(queryset, params):
+    """facet_counts() cached under the filter parameters that produced ``queryset``."""
+    cache = caches['shared']
+    generation = cache.get_or_set(GENERATION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+    params = hashlib.md5(repr(sorted(params.items())).encode(), usedforsecurity=False).hexdigest()
+    key = FACETS_KEY.format(generation=generation, params=params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = facet_counts(queryset)
+        cache.set(key, facets, timeout=FACETS_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    caches['shared'].set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
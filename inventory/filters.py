@@ -0,0 +1,83 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """Category, price and stock filters, each backed by an index on Product.
+
+    ?main_category=Food,Treat  ?sub_category=Dry  ?min_price=100  ?max_price=500
+    ?low_stock=true (quantity <= LOW_STOCK_THRESHOLD)
+    """
+    filter_params = ('main_category', 'sub_category', 'min_price', 'max_price', 'low_stock')
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        for field in ('main_category', 'sub_category'):
+            if params.get(field):
+                queryset = queryset.filter(**{f'{field}__in': params[field].split(',')})
+
+        if params.get('min_price'):
+            queryset = queryset.filter(selling_price__gte=self.decimal(params, 'min_price'))
+        if params.get('max_price'):
+            queryset = queryset.filter(selling_price__lte=self.decimal(params, 'max_price'))
+
+        if params.get('low_stock', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(quantity__lte=settings.LOW_STOCK_THRESHOLD)
+        return queryset
+
+    @staticmethod
+    def decimal(params, name):
+        try:
+            return Decimal(params[name])
+        except InvalidOperation:
+            raise ValidationError({name: 'Must be a number.'})
+
+
+class StockHistoryFilterBackend(BaseFilterBackend):
+    """Time range and action filters for StockHistory, applied within its timestamp indexes.
+
+    ?from=2025-03-01  ?to=2025-03-31T18:00:00Z  ?action=in,out
+    A bare date in ?to= includes that whole day.
+    """
+    filter_params = ('from', 'to', 'action')
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('from'):
+            start, _ = self.moment(params, 'from')
+            queryset = queryset.filter(timestamp__gte=start)
+        if params.get('to'):
+            end, whole_day = self.moment(params, 'to')
+            if whole_day:
+                queryset = queryset.filter(timestamp__lt=end + timedelta(days=1))
+            else:
+                queryset = queryset.filter(timestamp__lte=end)
+
+        if params.get('action'):
+            actions = params['action'].split(',')
+            choices = [choice for choice, _ in queryset.model.ACTION_CHOICES]
+            if not set(actions) <= set(choices):
+                raise ValidationError({'action': f"Must be among: {', '.join(choices)}."})
+            queryset = queryset.filter(action__in=actions)
+        return queryset
+
+    @staticmethod
+    def moment(params, name):
+        """The parameter as an aware datetime, and whether it was a bare date."""
+        value = params[name]
+        try:
+            day = parse_date(value)
+            if day is not None:
+                return timezone.make_aware(datetime.combine(day, time.min)), True
+            moment = parse_datetime(value)
+        except ValueError:  # well formed but impossible, e.g. 2025-02-30
+            moment = None
+        if moment is None:
+            raise ValidationError({name: 'Must be an ISO 8601 date or datetime.'})
+        return (moment if timezone.is_aware(moment) else timezone.make_aware(moment)), False
@@ -0,0 +1,124 @@
+"""Streaming bulk import of products from CSV or JSON Lines.
+
+The file is read lazily and handled ``chunk_size`` rows at a time. Each
+chunk is validated row by row. The valid products and their initial 'in'
+StockHistory entries are then written with two bulk_create calls inside one
+transaction. Memory use is bounded by the chunk size, not by the file size.
+Rows that fail validation are reported by line number and the rest of the
+file is still imported.
+"""
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Product, StockHistory
+from .serializers import ProductImportSerializer
+from .signals import products_bulk_changed
+
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+# Only the first errors are itemised; 'failed' still counts every bad row
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def format_for(filename):
+    """Import format implied by a file name's extension."""
+    for extension, fmt in IMPORT_FORMATS.items():
+        if filename.lower().endswith(extension):
+            return fmt
+    raise ImportFormatError(f"Unsupported file type; expected one of {', '.join(IMPORT_FORMATS)}.")
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, row dict) from a binary file; unparsable rows come as a ValidationError."""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        yield from _read_csv(lines)
+    elif fmt == 'jsonl':
+        yield from _read_jsonl(lines)
+    else:
+        raise ImportFormatError(f"Unknown import format {fmt!r}.")
+
+
+def _read_csv(lines):
+    reader = csv.DictReader(lines)
+    reader.fieldnames  # consume the header
+    line = reader.line_num + 1
+    for row in reader:
+        if None in row:
+            row = _row_error('Too many columns.')
+        yield line, row
+        line = reader.line_num + 1
+
+
+def _read_jsonl(lines):
+    for line, text in enumerate(lines, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = _row_error('Invalid JSON.')
+        yield line, row if isinstance(row, dict) else _row_error('Expected a JSON object.')
+
+
+def _row_error(message):
+    return ValidationError({'non_field_errors': [message]})
+
+
+def import_products(rows, chunk_size=None):
+    """Imports (line, row) pairs; returns {'created', 'failed', 'errors': [{'line', 'errors'}]}."""
+    chunk_size = max(1, chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE)
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        _import_chunk(chunk, report)
+    return report
+
+
+def _import_chunk(chunk, report):
+    # One serializer validates the whole chunk, as ListSerializer does
+    validator = ProductImportSerializer()
+    products, lines = [], []
+    for line, row in chunk:
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            product = Product(**validator.run_validation(row))
+        except ValidationError as exc:
+            _report_error(report, line, exc.detail)
+            continue
+        product.compile_code()  # bulk_create skips Product.save()
+        products.append(product)
+        lines.append(line)
+
+    if not products:
+        return
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            StockHistory.objects.bulk_create([
+                StockHistory(product=product, action='in', quantity_changed=product.quantity)
+                for product in products
+            ])
+            products_bulk_changed.send(sender=Product, product_ids=[product.pk for product in products])
+    except DatabaseError as exc:
+        for line in lines:
+            _report_error(report, line, {'non_field_errors': [f'Not saved: {exc}']})
+        return
+    report['created'] += len(products)
+
+
+def _report_error(report, line, errors):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'line': line, 'errors': errors})
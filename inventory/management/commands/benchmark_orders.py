@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from inventory.models import Order, OrderItem, Product, ProductTombstone, StockHistory
+from inventory.orders import place_order
+from inventory.stock import StockAdjustmentError
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def legacy_order(customer, items):
+    """The previous OrderSerializer.create: no transaction, read-check-save per line."""
+    order = Order.objects.create(customer=customer)
+    for item in items:
+        product = Product.objects.get(pk=item['product_id'])  # loaded by the serializer's related field
+        if product.quantity < item['quantity']:
+            raise OutOfStock
+        product.quantity -= item['quantity']
+        product.save()
+        StockHistory.objects.create(product=product, action='out', quantity_changed=item['quantity'])
+        OrderItem.objects.create(order=order, product=product, quantity=item['quantity'])
+    return order
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent checkouts against seeded products with the legacy and the atomic order code, "
+        "reporting orders/sec and whether stock was oversold. Needs a database with row locking "
+        "(e.g. PostgreSQL) for meaningful concurrency; seeded rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=50, help="Checkout attempts per thread.")
+        parser.add_argument('--stock', type=int, default=100, help="Initial quantity of each product.")
+        parser.add_argument('--lines', type=int, default=3, help="Products per order.")
+
+    def handle(self, *args, **options):
+        for label, place in (('legacy', legacy_order), ('atomic', place_order)):
+            self.run(label, place, options)
+
+    def run(self, label, place, options):
+        customer = get_user_model().objects.create(email=f'benchmark-{label}-{time.time_ns()}@example.com')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f"Benchmark order product {index}", description="", quantity=options['stock'],
+                purchased_price='1.00', selling_price='2.00', date_purchased=date(2025, 1, 1),
+                supplier_name="Benchmark Supplier", main_category='Food', sub_category='Dry',
+                product_code='AD-BS-CT-LS-NOBRJMAS',
+            )
+            for index in range(options['lines'])
+        ])
+        items = [{'product_id': product.pk, 'quantity': 1} for product in products]
+        outcomes = {'placed': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def checkout():
+            try:
+                for _ in range(options['orders']):
+                    try:
+                        place(customer, items)
+                        outcome = 'placed'
+                    except (OutOfStock, StockAdjustmentError):
+                        outcome = 'rejected'
+                    except DatabaseError:
+                        outcome = 'errors'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sold = OrderItem.objects.filter(product__in=products).count()
+        remaining = sum(Product.objects.filter(pk__in=[p.pk for p in products]).values_list('quantity', flat=True))
+        initial = len(products) * options['stock']
+        drift = remaining - (initial - sold)  # non-zero: decrements were lost
+        self.stdout.write(
+            f"{label:8} {outcomes['placed'] / elapsed:8.1f} orders/s  placed={outcomes['placed']} "
+            f"rejected={outcomes['rejected']} errors={outcomes['errors']} "
+            f"oversold={max(sold - initial, 0)} stock_drift={drift}"
+        )
+
+        Order.objects.filter(customer=customer).delete()
+        Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+        ProductTombstone.objects.filter(product_id__in=[p.pk for p in products]).delete()
+        customer.delete()
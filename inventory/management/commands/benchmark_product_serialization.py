@@ -0,0 +1,71 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from inventory.models import Product
+from inventory.views import ProductViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Seeds a throwaway catalog and compares product list payload size and serialization time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['count'])
+                variants = [
+                    ('full', {}),
+                    ('fields=id,name,selling_price,image', {'fields': 'id,name,selling_price,image'}),
+                    ('omit=description', {'omit': 'description'}),
+                    ('view=compact', {'view': 'compact'}),
+                ]
+                for label, params in variants:
+                    self.measure(label, params, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"Benchmark product {index}",
+                    description="Grain-free kibble with salmon and sweet potato. " * 8,
+                    quantity=index % 50, purchased_price='120.00', selling_price='185.50',
+                    date_purchased=date(2025, 1, 1), supplier_name="Benchmark Supplier Inc.",
+                    main_category='Food', sub_category='Dry', product_code='AD-BS-CT-LS-NOBRJMAS',
+                    image=f"product_images/benchmark_{index}",
+                )
+                for index in range(count)
+            ],
+            batch_size=1000,
+        )
+
+    def measure(self, label, params, repeat):
+        request = Request(RequestFactory().get('/api/inventory/products/', params))
+        view = ProductViewSet(request=request, action='list', format_kwarg=None)
+        serializer_class = view.get_serializer_class()
+
+        best, payload = None, b''
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = Product.objects.order_by('-created_at', '-id').only(*view.get_loaded_fields())
+            data = serializer_class(queryset, many=True, context={'request': request}).data
+            payload = JSONRenderer().render(data)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        self.stdout.write(f"{label:40} {len(payload) / 1024:10.1f} KiB {best * 1000:10.1f} ms")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.materialized import inconsistencies
+from inventory.models import MaterializedRecommendation
+
+
+class Command(BaseCommand):
+    help = "Compares the materialized recommendation table against the live matcher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Repair the rows that disagree.")
+
+    def handle(self, *args, **options):
+        problems = 0
+        for signature, missing, extra in inconsistencies():
+            problems += 1
+            self.stdout.write(f"{signature}: missing {missing}, unexpected {extra}")
+            if options['fix']:
+                MaterializedRecommendation.objects.filter(signature=signature, product_id__in=extra).delete()
+                MaterializedRecommendation.objects.bulk_create(
+                    [MaterializedRecommendation(signature=signature, product_id=pk) for pk in missing],
+                    ignore_conflicts=True,
+                )
+
+        if problems and not options['fix']:
+            raise CommandError(f"{problems} signatures are inconsistent; rerun with --fix to repair.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired {problems} signatures." if problems else "Materialized recommendations are consistent."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.sync import compact_tombstones
+
+
+class Command(BaseCommand):
+    help = "Deletes product tombstones older than TOMBSTONE_RETENTION_DAYS."
+
+    def handle(self, *args, **options):
+        count = compact_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} tombstones."))
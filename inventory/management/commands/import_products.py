@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importer import ImportFormatError, format_for, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = "Imports products from a .csv or .jsonl file, with their initial stock history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, help="Rows per transaction (PRODUCT_IMPORT_CHUNK_SIZE).")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or format_for(options['path'])
+            with open(options['path'], 'rb') as stream:
+                report = import_products(read_rows(stream, fmt), chunk_size=options['chunk_size'])
+        except (OSError, ImportFormatError, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report['created']} products, {report['failed']} rows failed."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.materialized import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialized recommendation table from every dog profile signature."
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Materialized recommendations for {count} profile signatures."))
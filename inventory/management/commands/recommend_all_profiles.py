@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from inventory.recommendations import batch_recommendations
+
+
+class Command(BaseCommand):
+    help = "Computes recommendations for every dog profile and writes them as JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="File to write to (default: stdout).")
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stderr.write(f"\r{done}/{total} profile signatures", ending='')
+
+        records = batch_recommendations(progress=progress)
+        count = 0
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                for record in records:
+                    out.write(json.dumps(record) + '\n')
+                    count += 1
+        else:
+            for record in records:
+                self.stdout.write(json.dumps(record))
+                count += 1
+
+        self.stderr.write('')
+        self.stderr.write(self.style.SUCCESS(f"Wrote recommendations for {count} dog profiles."))
@@ -0,0 +1,130 @@
+"""Maintenance of the materialized (profile signature, product) table.
+
+Matches are kept up to date incrementally: a changed product is re-matched
+against the distinct signatures only, and a new signature is matched against
+the catalog once. RecommendationView then reads with one indexed join.
+
+A new signature row is committed before the catalog is read, and both
+materialize_signature() and rematch_products() lock signature rows before
+reading products. A product saved while a signature is being matched is
+therefore either seen by the match or re-matched against the signature
+afterwards, never missed by both.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .codes import CODE_MASK_FIELDS, accepts, stored_profile_codes
+from .models import MaterializedRecommendation, Product, RecommendationSignature
+from .recommendations import MAIN_CATEGORIES, CatalogIndex, profile_signature, signature_codes
+from .sync import COMMIT_SKEW
+
+
+def materialized_products(signature):
+    return Product.objects.filter(materialized_recommendations__signature=signature)
+
+
+def is_materialized(signature):
+    return RecommendationSignature.objects.filter(signature=signature).exists()
+
+
+def materialize_signature(signature, catalog=None):
+    """Matches a signature against the catalog once; no-op if already materialized."""
+    _, created = RecommendationSignature.objects.get_or_create(signature=signature)
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            list(RecommendationSignature.objects.select_for_update().filter(signature=signature).values_list('pk'))
+            if catalog is not None:
+                product_ids = catalog.match(signature_codes(signature))
+            else:
+                # The database matcher is always current, unlike another process's in-memory index
+                product_ids = (
+                    Product.objects.filter(main_category__in=MAIN_CATEGORIES)
+                    .recommended_for(signature_codes(signature))
+                    .values_list('pk', flat=True)
+                )
+            MaterializedRecommendation.objects.bulk_create(
+                [MaterializedRecommendation(signature=signature, product_id=pk) for pk in product_ids],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+    except Exception:
+        if not transaction.get_connection().in_atomic_block:
+            RecommendationSignature.objects.filter(signature=signature).delete()  # retried on the next save
+        raise
+
+
+def rematch_product(product_id):
+    """Re-matches one product against every materialized signature."""
+    rematch_products([product_id])
+
+
+def rematch_products(product_ids):
+    """Re-matches products against every materialized signature; deleted ids are skipped."""
+    with transaction.atomic():
+        locked = RecommendationSignature.objects.select_for_update().order_by('pk')
+        signatures = [
+            (signature, signature_codes(signature)) for signature in locked.values_list('signature', flat=True)
+        ]
+        products = Product.objects.filter(pk__in=product_ids).values('pk', 'main_category', *CODE_MASK_FIELDS)
+
+        accepted, seen = [], []
+        for product in products:
+            seen.append(product['pk'])
+            if product['main_category'] not in MAIN_CATEGORIES:
+                continue
+            masks = [product[field] for field in CODE_MASK_FIELDS]
+            accepted += [
+                MaterializedRecommendation(signature=signature, product_id=product['pk'])
+                for signature, codes in signatures if accepts(masks, codes)
+            ]
+
+        stale = MaterializedRecommendation.objects.filter(product_id__in=seen)
+        keep = {(row.signature, row.product_id) for row in accepted}
+        stale_ids = [
+            pk for pk, signature, product_id in stale.values_list('pk', 'signature', 'product_id')
+            if (signature, product_id) not in keep
+        ]
+        MaterializedRecommendation.objects.filter(pk__in=stale_ids).delete()
+        MaterializedRecommendation.objects.bulk_create(accepted, batch_size=1000, ignore_conflicts=True)
+
+
+def profile_signatures():
+    """Distinct signatures of every DogProfile."""
+    from users.models import DogProfile
+
+    profiles = DogProfile.objects.only(*CODE_MASK_FIELDS).iterator()
+    return {profile_signature(stored_profile_codes(dog)) for dog in profiles}
+
+
+def rebuild():
+    """Recreates the whole table from the DogProfile signatures and a fresh catalog pass."""
+    started = timezone.now() - COMMIT_SKEW
+    with transaction.atomic():
+        # Deleting locks every signature row, so rematch_products() waits for the
+        # rebuild, and the catalog read below sees everything committed before it
+        MaterializedRecommendation.objects.all().delete()
+        RecommendationSignature.objects.all().delete()
+        catalog = CatalogIndex.from_database()
+        signatures = profile_signatures()
+        for signature in sorted(signatures):
+            materialize_signature(signature, catalog=catalog)
+        # Products committed while the catalog was read, or re-matched against
+        # the signatures being replaced, are matched again once the rebuild is visible
+        transaction.on_commit(
+            lambda: rematch_products(list(Product.objects.filter(updated_at__gte=started).values_list('pk', flat=True)))
+        )
+    return len(signatures)
+
+
+def inconsistencies(catalog=None):
+    """Yields (signature, missing_ids, extra_ids) where the table disagrees with the live matcher."""
+    catalog = catalog or CatalogIndex.from_database()
+    for signature in RecommendationSignature.objects.values_list('signature', flat=True).iterator():
+        expected = set(catalog.match(signature_codes(signature)))
+        actual = set(
+            MaterializedRecommendation.objects.filter(signature=signature).values_list('product_id', flat=True)
+        )
+        if expected != actual:
+            yield signature, sorted(expected - actual), sorted(actual - expected)
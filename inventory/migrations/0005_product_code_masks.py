@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_alter_product_image_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='coat_mask',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='health_mask',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='life_stage_mask',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='role_mask',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='size_mask',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['main_category', 'life_stage_mask', 'size_mask', 'coat_mask', 'role_mask', 'health_mask'], name='product_code_masks_idx'),
+        ),
+    ]
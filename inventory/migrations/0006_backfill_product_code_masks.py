@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from inventory.codes import CODE_MASK_FIELDS, compile_product_code
+
+
+def backfill_code_masks(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    batch = []
+    for product in Product.objects.only('id', 'product_code').iterator(chunk_size=500):
+        masks = compile_product_code(product.product_code) or (None,) * len(CODE_MASK_FIELDS)
+        for field, mask in zip(CODE_MASK_FIELDS, masks):
+            setattr(product, field, mask)
+        batch.append(product)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, CODE_MASK_FIELDS)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, CODE_MASK_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_product_code_masks'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_code_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_backfill_product_code_masks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MaterializedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=100)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='materialized_recommendations', to='inventory.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('signature', 'product'), name='unique_signature_product')],
+            },
+        ),
+    ]
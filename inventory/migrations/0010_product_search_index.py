@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# Postgres: a generated, weighted tsvector column with a GIN index, so the
+# index follows every write without application code.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE inventory_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(main_category, '') || ' ' || coalesce(sub_category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(supplier_name, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX product_search_vector_idx ON inventory_product USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "ALTER TABLE inventory_product DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite (local development): an FTS5 shadow table keyed by product id,
+# maintained by triggers.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE inventory_product_fts USING fts5(
+        name, categories, supplier_name, description, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER inventory_product_fts_insert AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts (rowid, name, categories, supplier_name, description)
+        VALUES (new.id, new.name, new.main_category || ' ' || new.sub_category, new.supplier_name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER inventory_product_fts_update
+    AFTER UPDATE OF name, main_category, sub_category, supplier_name, description ON inventory_product BEGIN
+        DELETE FROM inventory_product_fts WHERE rowid = old.id;
+        INSERT INTO inventory_product_fts (rowid, name, categories, supplier_name, description)
+        VALUES (new.id, new.name, new.main_category || ' ' || new.sub_category, new.supplier_name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER inventory_product_fts_delete AFTER DELETE ON inventory_product BEGIN
+        DELETE FROM inventory_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    INSERT INTO inventory_product_fts (rowid, name, categories, supplier_name, description)
+    SELECT id, name, main_category || ' ' || sub_category, supplier_name, description FROM inventory_product
+    """,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS inventory_product_fts_insert",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_update",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_delete",
+    "DROP TABLE IF EXISTS inventory_product_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {'postgresql': postgres, 'sqlite': sqlite}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_product_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
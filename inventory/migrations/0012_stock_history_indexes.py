@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['product', '-timestamp', '-id'], name='stockhistory_product_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['-timestamp', '-id'], name='stockhistory_time_idx'),
+        ),
+    ]
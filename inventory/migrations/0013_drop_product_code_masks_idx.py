@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stock_history_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_code_masks_idx',
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import F
 from cloudinary.models import CloudinaryField
 from django.contrib.auth import get_user_model
 
+from .codes import CODE_BITS, CODE_MASK_FIELDS, compile_product_code
+
 # ==========================
 # Choices for categories
 # ==========================
@@ -29,6 +32,35 @@ SUB_CATEGORIES = [
 # Product Model
 # ==========================
 
+class ProductQuerySet(models.QuerySet):
+    def recommended_for(self, codes):
+        """Products whose compiled code accepts the given profile_codes() tuple.
+
+        The bitand tests cannot use a B-tree index, so this scans the catalog;
+        requests are answered from the materialized table or CatalogIndex instead.
+        """
+        life_stage, size, coat_type, role, health_codes = codes
+        if not health_codes:
+            return self.none()
+
+        # Malformed product codes are never recommended
+        qs = self.filter(health_mask__isnull=False)
+
+        wanted = zip(CODE_MASK_FIELDS, (life_stage, size, coat_type, role))
+        for field, value in wanted:
+            if value:  # "" accepts every segment
+                qs = qs.alias(**{f'{field}_hit': F(field).bitand(CODE_BITS[value])})
+                qs = qs.filter(**{f'{field}_hit__gt': 0})
+
+        if "" not in health_codes:
+            health_bits = 0
+            for code in health_codes:
+                health_bits |= CODE_BITS[code]
+            qs = qs.alias(health_mask_hit=F('health_mask').bitand(health_bits))
+            qs = qs.filter(health_mask_hit__gt=0)
+        return qs
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
@@ -44,14 +76,75 @@ class Product(models.Model):
     # Recommendation-based dog suitability code
     product_code = models.CharField(max_length=30)
 
+    # product_code compiled per segment (see inventory.codes); NULL if malformed
+    life_stage_mask = models.PositiveIntegerField(null=True, editable=False)
+    size_mask = models.PositiveIntegerField(null=True, editable=False)
+    coat_mask = models.PositiveIntegerField(null=True, editable=False)
+    role_mask = models.PositiveIntegerField(null=True, editable=False)
+    health_mask = models.PositiveIntegerField(null=True, editable=False)
+
     image = CloudinaryField('image', blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog, newest first
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            # Delta sync (updated_at > token) and the max(updated_at) ETag validator
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id_idx'),
+            # ProductFilterBackend filters and the facet GROUP BY
+            models.Index(fields=['main_category', 'sub_category'], name='product_category_idx'),
+            models.Index(fields=['selling_price'], name='product_price_idx'),
+            models.Index(fields=['quantity'], name='product_quantity_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.product_code}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self, names):
+        """Which of ``names`` differ from their last loaded or saved values; unknown ones count as changed."""
+        saved = getattr(self, '_saved_values', {})
+        return {name for name in names if name not in saved or saved[name] != getattr(self, name)}
+
+    def compile_code(self):
+        masks = compile_product_code(self.product_code) or (None,) * len(CODE_MASK_FIELDS)
+        for field, mask in zip(CODE_MASK_FIELDS, masks):
+            setattr(self, field, mask)
+
+    def save(self, *args, **kwargs):
+        self.compile_code()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'product_code' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *CODE_MASK_FIELDS}
+        super().save(*args, **kwargs)  # post_save handlers still see the previous values
+
+        saved = kwargs['update_fields'] if update_fields is not None else [
+            field.attname for field in self._meta.concrete_fields if field.attname not in self.get_deferred_fields()
+        ]
+        self._saved_values = {**getattr(self, '_saved_values', {}), **{name: getattr(self, name) for name in saved}}
+
+# ==========================
+# Product Tombstones (delta sync)
+# ==========================
+
+class ProductTombstone(models.Model):
+    """Records a deleted product so syncing clients can drop it."""
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Product #{self.product_id} deleted @ {self.deleted_at}"
+
 # ==========================
 # Stock History Model
 # ==========================
@@ -68,6 +161,14 @@ class StockHistory(models.Model):
     quantity_changed = models.IntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of one product's history, newest first
+            models.Index(fields=['product', '-timestamp', '-id'], name='stockhistory_product_time_idx'),
+            # Keyset pagination of the cross-product feed
+            models.Index(fields=['-timestamp', '-id'], name='stockhistory_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.action} ({self.quantity_changed}) @ {self.timestamp}"
 
@@ -88,3 +189,29 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
+
+
+# ==========================
+# Materialized Recommendations
+# ==========================
+
+class RecommendationSignature(models.Model):
+    """A dog profile signature whose matches are kept in MaterializedRecommendation."""
+    signature = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.signature
+
+
+class MaterializedRecommendation(models.Model):
+    signature = models.CharField(max_length=100)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='materialized_recommendations')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['signature', 'product'], name='unique_signature_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.signature} -> {self.product_id}"
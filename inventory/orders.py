@@ -0,0 +1,39 @@
+"""Order placement as one atomic unit.
+
+Stock is taken with the same conditional UPDATE as bulk adjustments
+(``quantity = quantity - n WHERE quantity >= n``), so the check and the
+decrement are a single statement, after the rows are locked in id order. Two checkouts racing for the last unit
+cannot both succeed, whatever quantity they read earlier. The order, its
+items and the stock history are written in a fixed number of statements
+however many lines the order has. A failure on any line rolls back the whole
+order.
+"""
+from django.db import transaction
+
+from .models import Order, OrderItem, Product
+from .stock import adjust_stock
+
+
+def place_order(customer, items, **fields):
+    """Creates an Order for [{'product_id', 'quantity'}] all or nothing.
+
+    Raises StockAdjustmentError if a product is unknown or short of stock.
+    """
+    with transaction.atomic():
+        order = Order.objects.create(customer_id=customer.pk, **fields)  # a claims user is not a model
+        adjust_stock([{'product': item['product_id'], 'delta': -item['quantity']} for item in items])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item['product_id'], quantity=item['quantity'])
+            for item in items
+        ])
+    return order
+
+
+def rejection_messages(errors):
+    """Human-readable messages for StockAdjustmentError.errors."""
+    names = dict(Product.objects.filter(pk__in=[error['product'] for error in errors]).values_list('pk', 'name'))
+    return [
+        f"Not enough stock for {names[error['product']]}" if error['product'] in names
+        else f"Product {error['product']} does not exist"
+        for error in errors
+    ]
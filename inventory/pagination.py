@@ -0,0 +1,113 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a unique composite ordering, e.g. (created_at, id).
+
+    The cursor holds the ordering values of the last row served, and the next
+    page is a ``WHERE (a, b) < (x, y)`` range over an index on the same
+    columns, so deep pages cost the same as the first one. No OFFSET is used.
+    """
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    @classmethod
+    def ordering_fields(cls):
+        return [name.lstrip('-') for name in cls.ordering]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be an integer.'})
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(self.decode_cursor(encoded, queryset.model)))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def after(self, values):
+        """Rows strictly after ``values`` in the ordering, as a lexicographic comparison."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+            for previous, (previous_name, _) in enumerate(self.fields[:index]):
+                step &= Q(**{previous_name: values[previous]})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, row):
+        values = [getattr(row, name) for name, _ in self.fields]
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, encoded, model):
+        try:
+            raw = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(raw) != len(self.fields):
+                raise ValueError
+            return [self.to_python(model, name, value) for (name, _), value in zip(self.fields, raw)]
+        except (ValueError, TypeError, DjangoValidationError):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+
+    @staticmethod
+    def to_python(model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:  # an annotation such as a search rank
+            return value
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class StockHistoryPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class SearchPagination(KeysetPagination):
+    ordering = ('-rank', 'id')
+    page_size = 20
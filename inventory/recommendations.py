@@ -0,0 +1,286 @@
+"""In-process recommendation engine over the compiled product code masks.
+
+The catalog is held as one bitset per (segment, code): bit ``i`` of
+``bitsets[segment][code]`` is set when the product at position ``i`` accepts
+``code`` in that segment. Matching a dog profile is then a handful of big-int
+ANDs over the whole catalog instead of a Python loop per product.
+
+Each process holds its own index, tagged with the catalog generation from the
+'shared' cache. A catalog write sets a new generation, and every process
+rebuilds on its next get_catalog() once it sees a different value there.
+"""
+import heapq
+import threading
+import uuid
+from array import array
+
+from django.core.cache import caches
+
+from .codes import (
+    CODES, CODE_BITS, CODE_MASK_FIELDS, exact_segment_mask, split_product_code, stored_profile_codes,
+)
+from .models import Product
+
+MAIN_CATEGORIES = ['Food', 'Treat', 'Health', 'Grooming', 'Wellness']
+
+
+def _bitset(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _positions(bitset):
+    positions = []
+    for byte_index, byte in enumerate(bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')):
+        while byte:
+            low = byte & -byte
+            positions.append((byte_index << 3) + low.bit_length() - 1)
+            byte ^= low
+    return positions
+
+
+class CatalogIndex:
+    def __init__(self, rows):
+        """Builds the index from (pk, product_code, life_stage, size, coat, role, health mask) rows."""
+        self.ids = array('q')
+        self.generation = None  # set by get_catalog()
+        valid = []
+        members = [{code: [] for code in CODES} for _ in CODE_MASK_FIELDS]
+        exact_members = [{code: [] for code in CODES} for _ in CODE_MASK_FIELDS]
+
+        for position, (pk, product_code, *masks) in enumerate(rows):
+            self.ids.append(pk)
+            if masks[-1] is None:  # malformed product code
+                continue
+            valid.append(position)
+            segments = split_product_code(product_code)
+            for segment, mask in enumerate(masks):
+                exact = exact_segment_mask(segments[segment])
+                for code in CODES:
+                    if mask & CODE_BITS[code]:
+                        members[segment][code].append(position)
+                    if exact & CODE_BITS[code]:
+                        exact_members[segment][code].append(position)
+
+        size = len(self.ids)
+        self.valid = _bitset(valid, size)
+        self.bitsets = [
+            {code: _bitset(positions, size) for code, positions in segment.items()}
+            for segment in members
+        ]
+        # Same layout, but only where the code is spelled out rather than wildcarded
+        self.exact = [
+            {code: _bitset(positions, size) for code, positions in segment.items()}
+            for segment in exact_members
+        ]
+
+    @classmethod
+    def from_database(cls):
+        rows = (
+            Product.objects.filter(main_category__in=MAIN_CATEGORIES)
+            .order_by('pk')
+            .values_list('pk', 'product_code', *CODE_MASK_FIELDS)
+        )
+        return cls(rows.iterator(chunk_size=2000))
+
+    def match_bitset(self, codes):
+        """Bitset of catalog positions accepted by a profile_codes() tuple."""
+        life_stage, size, coat_type, role, health_codes = codes
+        if not health_codes:
+            return 0
+
+        result = self.valid
+        for segment, value in enumerate((life_stage, size, coat_type, role)):
+            if value:  # "" accepts every segment
+                result &= self.bitsets[segment][value]
+
+        if "" not in health_codes:
+            health = 0
+            for code in health_codes:
+                health |= self.bitsets[4][code]
+            result &= health
+        return result
+
+    def match(self, codes):
+        """Primary keys of matching products, in ascending order."""
+        return [self.ids[position] for position in _positions(self.match_bitset(codes))]
+
+    def scores(self, codes):
+        """Maps each matching position to its score.
+
+        Every accepted profile code scores 1, or 2 when the product code
+        spells it out instead of matching through a wildcard, so products
+        covering more health codes, and exact matches, rank higher.
+        """
+        matched = self.match_bitset(codes)
+        scores = dict.fromkeys(_positions(matched), 0)
+        if not scores:
+            return scores
+
+        life_stage, size, coat_type, role, health_codes = codes
+        wanted = [(segment, value) for segment, value in enumerate((life_stage, size, coat_type, role)) if value]
+        wanted += [(4, code) for code in sorted(set(health_codes)) if code]
+        for segment, code in wanted:
+            for bitsets in (self.bitsets, self.exact):
+                for position in _positions(bitsets[segment][code] & matched):
+                    scores[position] += 1
+        return scores
+
+    def rank(self, codes, limit, after=None):
+        """Top ``limit`` (pk, score) pairs, best first, ties broken by pk.
+
+        ``after`` is the (score, pk) of the last item of the previous page.
+        """
+        candidates = ((-score, self.ids[position]) for position, score in self.scores(codes).items())
+        if after is not None:
+            boundary = (-after[0], after[1])
+            candidates = (key for key in candidates if key > boundary)
+        return [(pk, -negative_score) for negative_score, pk in heapq.nsmallest(limit, candidates)]
+
+
+# ==========================
+# Per-process index kept in step with the shared generation
+# ==========================
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def _new_generation():
+    # Random rather than a counter: if the key is evicted, a fresh value can
+    # never match the generation of some process's stale index.
+    return uuid.uuid4().hex[:12]
+
+
+def catalog_generation():
+    return caches['shared'].get_or_set(CATALOG_GENERATION_KEY, _new_generation, timeout=None)
+
+
+def get_catalog():
+    global _catalog
+    # Read before the catalog query: a write committed meanwhile bumps it again
+    generation = catalog_generation()
+    catalog = _catalog
+    if catalog is None or catalog.generation != generation:
+        with _lock:
+            if _catalog is None or _catalog.generation != generation:
+                _catalog = CatalogIndex.from_database()
+                _catalog.generation = generation
+            catalog = _catalog
+    return catalog
+
+
+def invalidate_catalog(**kwargs):
+    """Drops the index in this process and, through the generation, in every other one."""
+    global _catalog
+    caches['shared'].set(CATALOG_GENERATION_KEY, _new_generation(), timeout=None)
+    with _lock:
+        _catalog = None
+
+
+# ==========================
+# Profile signatures
+# ==========================
+
+USER_KEY = 'recs:user:{user_id}'
+# Results read from the materialized table vs matched live, and user -> signature lookups
+HITS_KEY = 'recs:hits'
+MISSES_KEY = 'recs:misses'
+SIGNATURE_HITS_KEY = 'recs:signature:hits'
+SIGNATURE_MISSES_KEY = 'recs:signature:misses'
+
+
+def recommendation_cache():
+    return caches['recommendations']
+
+
+def profile_signature(codes):
+    """Normalized, order-independent key for a profile_codes() tuple."""
+    life_stage, size, coat_type, role, health_codes = codes
+    return '|'.join([life_stage, size, coat_type, role, ','.join(sorted(set(health_codes)))])
+
+
+def signature_codes(signature):
+    """Inverse of profile_signature()."""
+    life_stage, size, coat_type, role, health = signature.split('|')
+    return life_stage, size, coat_type, role, health.split(',') if health else []
+
+
+def _count(key):
+    cache = recommendation_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def cached_user_signature(user_id, load_codes):
+    """Profile signature of a user, computing it with load_codes() on a miss."""
+    cache = recommendation_cache()
+    key = USER_KEY.format(user_id=user_id)
+    signature = cache.get(key)
+    if signature is not None:
+        _count(SIGNATURE_HITS_KEY)
+        return signature
+
+    _count(SIGNATURE_MISSES_KEY)
+    signature = profile_signature(load_codes())
+    cache.set(key, signature)
+    return signature
+
+
+def invalidate_user_signature(user_id):
+    recommendation_cache().delete(USER_KEY.format(user_id=user_id))
+
+
+def count_result(materialized):
+    _count(HITS_KEY if materialized else MISSES_KEY)
+
+
+def cache_stats():
+    """Result hits (materialized) and misses (matched live), plus the user -> signature lookups."""
+    cache = recommendation_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'signature_hits': cache.get(SIGNATURE_HITS_KEY, 0),
+        'signature_misses': cache.get(SIGNATURE_MISSES_KEY, 0),
+    }
+
+
+# ==========================
+# Batch computation for every dog profile
+# ==========================
+
+def batch_recommendations(progress=None):
+    """Yields {user_id, email, signature, product_ids} for every DogProfile.
+
+    Profiles are grouped by signature so each distinct combination is
+    matched once, against a single fresh pass over the catalog.
+    progress(done, total) is called after each distinct signature.
+    """
+    from users.models import DogProfile
+
+    groups = {}
+    profiles = DogProfile.objects.select_related('owner').only('owner__email', *CODE_MASK_FIELDS)
+    for dog in profiles.iterator(chunk_size=2000):
+        signature = profile_signature(stored_profile_codes(dog))
+        groups.setdefault(signature, []).append((dog.owner_id, dog.owner.email))
+
+    catalog = CatalogIndex.from_database()
+    total = len(groups)
+    for done, (signature, owners) in enumerate(groups.items(), start=1):
+        product_ids = catalog.match(signature_codes(signature))
+        for user_id, email in owners:
+            yield {'user_id': user_id, 'email': email, 'signature': signature, 'product_ids': product_ids}
+        if progress is not None:
+            progress(done, total)
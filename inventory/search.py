@@ -0,0 +1,55 @@
+"""Ranked full-text product search.
+
+Backed by the ``search_vector`` tsvector column and its GIN index on
+Postgres, and by the ``inventory_product_fts`` FTS5 table on SQLite (see
+migration 0010). Other databases fall back to unranked ``icontains``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+SEARCH_FIELDS = ('name', 'description', 'supplier_name', 'main_category', 'sub_category')
+
+
+def fts5_query(text):
+    """Quotes each word so user input cannot inject FTS5 syntax; the last word is a prefix."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words[:-1]) + (f' "{words[-1]}"*' if words else '')
+
+
+def search_products(text, queryset=None):
+    """Products matching ``text``, annotated with ``rank`` (higher is better)."""
+    queryset = Product.objects.all() if queryset is None else queryset
+
+    if connection.vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.filter(
+            RawSQL(f"inventory_product.search_vector @@ {tsquery}", [text], output_field=BooleanField()),
+        ).annotate(
+            rank=RawSQL(f"ts_rank_cd(inventory_product.search_vector, {tsquery})", [text], output_field=FloatField()),
+        )
+
+    if connection.vendor == 'sqlite':
+        match = fts5_query(text)
+        if not match:
+            return queryset.none()
+        # bm25() is lower-is-better; columns weighted name > categories > supplier > description
+        return queryset.filter(
+            id__in=RawSQL("SELECT rowid FROM inventory_product_fts WHERE inventory_product_fts MATCH %s", [match]),
+        ).annotate(
+            rank=RawSQL(
+                "(SELECT -bm25(inventory_product_fts, 10.0, 5.0, 3.0, 1.0) FROM inventory_product_fts"
+                " WHERE inventory_product_fts MATCH %s AND rowid = inventory_product.id)",
+                [match],
+                output_field=FloatField(),
+            ),
+        )
+
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': text})
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
@@ -1,25 +1,101 @@
+from django.db import transaction
 from rest_framework import serializers
+
+from users.outbox import enqueue_mail
+
+from .codes import CODE_MASK_FIELDS
 from .models import Product, StockHistory, Order, OrderItem
+from .orders import place_order, rejection_messages
+from .stock import StockAdjustmentError
+
+def sparse_fieldset(available, query_params):
+    """Field names kept by ?fields=a,b (whitelist) and ?omit=c,d (blacklist)."""
+    keep = set(available)
+    if query_params.get('fields'):
+        keep &= {name.strip() for name in query_params['fields'].split(',')} | {'id'}
+    if query_params.get('omit'):
+        keep -= {name.strip() for name in query_params['omit'].split(',')} - {'id'}
+    return keep
+
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Drops the fields excluded by ?fields= / ?omit= when reading."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        for name in set(self.fields) - sparse_fieldset(self.fields, request.query_params):
+            self.fields.pop(name)
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False, allow_null=True)
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = CODE_MASK_FIELDS
         read_only_fields = ['created_at', 'updated_at']
 
 
+class ProductImportSerializer(serializers.ModelSerializer):
+    """One row of a bulk import; images are uploaded separately."""
+
+    class Meta:
+        model = Product
+        fields = [
+            'name', 'description', 'quantity', 'purchased_price', 'selling_price', 'date_purchased',
+            'supplier_name', 'main_category', 'sub_category', 'product_code',
+        ]
+
+
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Compact representation for catalog grids."""
+    thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'selling_price', 'quantity', 'main_category', 'sub_category', 'thumbnail']
+        read_only_fields = fields
+
+    # Model fields read by method fields, so views can load them with QuerySet.only()
+    method_field_sources = {'thumbnail': ['image']}
+
+    def get_thumbnail(self, obj):
+        if not obj.image:
+            return None
+        return obj.image.build_url(width=300, height=300, crop='fill', quality='auto', fetch_format='auto')
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    delta = serializers.IntegerField()
+
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError("Delta must not be zero.")
+        return value
+
 
 class StockHistorySerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
+    # From context['product_names'] ({id: name}, fetched once per page) when given
+    product_name = serializers.SerializerMethodField()
 
     class Meta:
         model = StockHistory
         fields = ['id', 'product', 'product_name', 'action', 'quantity_changed', 'timestamp']
 
+    def get_product_name(self, obj):
+        names = self.context.get('product_names')
+        return names.get(obj.product_id) if names is not None else obj.product.name
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    # A plain id: products are checked by the stock UPDATE, not fetched one by one
+    product = serializers.IntegerField(source='product_id', min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
@@ -35,43 +111,27 @@ class OrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         user = self.context['request'].user
-        order = Order.objects.create(customer=user, **validated_data)
-
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-
-            # Update stock
-            if product.quantity < quantity:
-                raise serializers.ValidationError(f"Not enough stock for {product.name}")
-            product.quantity -= quantity
-            product.save()
-
-            # Log stock history
-            StockHistory.objects.create(
-                product=product,
-                action='out',
-                quantity_changed=quantity
+        with transaction.atomic():
+            try:
+                order = place_order(user, items_data, **validated_data)
+            except StockAdjustmentError as exc:
+                raise serializers.ValidationError(rejection_messages(exc.errors) or [str(exc)])
+
+            # Queue the confirmation email; it is only sent if the order commits
+            names = dict(
+                Product.objects.filter(pk__in=[item['product_id'] for item in items_data]).values_list('pk', 'name')
+            )
+            product_lines = [
+                f"{item_data['quantity']} x {names[item_data['product_id']]}"
+                for item_data in items_data
+            ]
+            message_body = f"Thank you for your order!\n\nOrder Number: {order.id}\n\nItems:\n" + "\n".join(product_lines)
+
+            enqueue_mail(
+                subject='Your CanineRacks Order Confirmation',
+                message=message_body,
+                from_email='canineracks@gmail.com',
+                recipient_list=[user.email],
             )
-
-            OrderItem.objects.create(order=order, product=product, quantity=quantity)
-
-        # Send confirmation email
-        from django.core.mail import send_mail
-        from django.conf import settings
-
-        product_lines = [
-            f"{item_data['quantity']} x {item_data['product'].name}"
-            for item_data in items_data
-        ]
-        message_body = f"Thank you for your order!\n\nOrder Number: {order.id}\n\nItems:\n" + "\n".join(product_lines)
-
-        send_mail(
-            subject='Your CanineRacks Order Confirmation',
-            message=message_body,
-            from_email='canineracks@gmail.com',
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
 
         return order
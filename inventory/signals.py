@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.models import DogProfile
+
+from . import typeahead
+from .codes import stored_profile_codes
+from .facets import invalidate_facets
+from .materialized import materialize_signature, rematch_product, rematch_products
+from .models import Product, ProductTombstone
+from .recommendations import invalidate_catalog, invalidate_user_signature, profile_signature
+
+
+# Sent with product_ids=[...] by writes that bypass model signals
+# (bulk_create, QuerySet.update); send it inside the writing transaction.
+# An optional fields={...} names the columns written, so unrelated caches survive.
+products_bulk_changed = Signal()
+
+CATALOG_FIELDS = {'product_code', 'main_category'}
+TYPEAHEAD_FIELDS = {'name', 'supplier_name'}
+
+
+def product_caches_changed():
+    invalidate_catalog()
+    invalidate_facets()
+
+
+@receiver(products_bulk_changed)
+def products_changed_in_bulk(sender, product_ids, fields=None, **kwargs):
+    product_ids = list(product_ids)
+    transaction.on_commit(invalidate_facets)
+    if fields is None or fields & CATALOG_FIELDS:
+        transaction.on_commit(invalidate_catalog)
+        transaction.on_commit(lambda: rematch_products(product_ids))
+    if fields is None or fields & TYPEAHEAD_FIELDS:
+        transaction.on_commit(typeahead.catalog_changed)
+
+
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # Rebuild only once the change is visible to other connections
+    transaction.on_commit(product_caches_changed)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Same transaction as the delete, so a rollback leaves no tombstone behind
+    ProductTombstone.objects.create(product_id=instance.pk)
+    pk = instance.pk
+    transaction.on_commit(lambda: typeahead.product_deleted(pk))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_facets)
+    if instance.changed_fields(CATALOG_FIELDS):  # e.g. not for quantity or price edits
+        transaction.on_commit(invalidate_catalog)
+        transaction.on_commit(lambda: rematch_product(instance.pk))
+    if instance.changed_fields(TYPEAHEAD_FIELDS):
+        pk, name, supplier_name = instance.pk, instance.name, instance.supplier_name
+        transaction.on_commit(lambda: typeahead.product_saved(pk, name, supplier_name))
+
+
+@receiver([post_save, post_delete], sender=DogProfile)
+def dog_profile_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user_signature(instance.owner_id))
+
+
+@receiver(post_save, sender=DogProfile)
+def dog_profile_saved(sender, instance, **kwargs):
+    signature = profile_signature(stored_profile_codes(instance))
+    transaction.on_commit(lambda: materialize_signature(signature))
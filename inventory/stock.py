@@ -0,0 +1,83 @@
+"""Bulk stock adjustments applied as one conditional UPDATE.
+
+Every delta goes into a single ``UPDATE ... SET quantity = quantity + CASE
+id WHEN .. END WHERE id IN (..) AND quantity + CASE .. >= 0``. The database
+applies the arithmetic atomically, so concurrent adjustments never lose an
+update. The rows are locked first with SELECT ... FOR UPDATE ordered by id,
+because a single UPDATE takes its row locks in whatever order the plan visits
+them: two batches (or orders) sharing products then wait on each other
+instead of deadlocking. If fewer rows match than were requested, some product is missing or
+would go negative: the batch is rolled back as a whole and the failures are
+diagnosed afterwards.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from .models import Product, StockHistory
+from .signals import products_bulk_changed
+
+MAX_ADJUSTMENTS = 1000
+
+
+class StockAdjustmentError(Exception):
+    def __init__(self, errors):
+        super().__init__('No adjustments were applied.')
+        self.errors = errors
+
+
+class _Rejected(Exception):
+    pass
+
+
+def merge_deltas(adjustments):
+    """{product id: net delta} from [{'product', 'delta'}], dropping nets of zero."""
+    deltas = {}
+    for adjustment in adjustments:
+        deltas[adjustment['product']] = deltas.get(adjustment['product'], 0) + adjustment['delta']
+    return {pk: delta for pk, delta in deltas.items() if delta}
+
+
+def adjust_stock(adjustments):
+    """Applies the adjustments all or nothing; returns the StockHistory rows written.
+
+    Raises StockAdjustmentError listing unknown products and those that
+    would go below zero.
+    """
+    deltas = merge_deltas(adjustments)
+    if not deltas:
+        return []
+    delta = Case(*[When(pk=pk, then=Value(value)) for pk, value in deltas.items()], output_field=IntegerField())
+    new_quantity = F('quantity') + delta
+
+    try:
+        with transaction.atomic():
+            list(Product.objects.select_for_update().filter(pk__in=deltas).order_by('pk').values_list('pk'))
+            updated = Product.objects.filter(GreaterThanOrEqual(new_quantity, 0), pk__in=deltas).update(
+                quantity=new_quantity, updated_at=timezone.now(),  # update() skips auto_now
+            )
+            if updated != len(deltas):
+                raise _Rejected
+            history = StockHistory.objects.bulk_create([
+                StockHistory(product_id=pk, action='in' if value > 0 else 'out', quantity_changed=abs(value))
+                for pk, value in deltas.items()
+            ])
+            products_bulk_changed.send(sender=Product, product_ids=list(deltas), fields={'quantity'})
+    except _Rejected:
+        raise StockAdjustmentError(_rejections(deltas))
+    return history
+
+
+def _rejections(deltas):
+    quantities = dict(Product.objects.filter(pk__in=deltas).values_list('pk', 'quantity'))
+    errors = []
+    for pk, delta in deltas.items():
+        if pk not in quantities:
+            errors.append({'product': pk, 'error': 'Product not found.'})
+        elif quantities[pk] + delta < 0:
+            errors.append({
+                'product': pk, 'quantity': quantities[pk], 'delta': delta,
+                'error': 'Insufficient stock.',
+            })
+    return errors
@@ -0,0 +1,102 @@
+"""Catalog delta sync: opaque tokens, changed products and tombstones.
+
+A sync is a pass over the products changed since the client's token, in
+(updated_at, id) order, one keyset page at a time. The point the pass
+catches up to is fixed when it starts. While the pass is unfinished, the
+token also carries that point and the position of the last product served.
+Tombstones are sent with the first page of a pass.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Product, ProductTombstone
+
+TOKEN_SALT = 'inventory.sync'
+
+# Writes commit a little after their updated_at/deleted_at is stamped, so a
+# token points this far back; clients may see a change twice, never miss one.
+COMMIT_SKEW = timedelta(seconds=5)
+
+
+class SyncTokenInvalid(Exception):
+    pass
+
+
+class SyncTokenExpired(Exception):
+    """The token predates the retained tombstones; a full resync is required."""
+
+
+def retention_horizon():
+    return timezone.now() - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+
+
+def encode_token(since, until=None, after=None):
+    """Token for a client that has seen everything up to ``since`` (None: nothing yet).
+
+    Mid-pass tokens also carry ``until``, the point the pass catches up to,
+    and ``after``, the (updated_at, id) of the last product served.
+    """
+    payload = {'since': since.isoformat() if since else None}
+    if until is not None:
+        payload.update(until=until.isoformat(), after=[after[0].isoformat(), after[1]])
+    return signing.dumps(payload, salt=TOKEN_SALT, compress=True)
+
+
+def sync_point(since=None):
+    """The point a pass starting now catches up to."""
+    as_of = timezone.now() - COMMIT_SKEW
+    if since is not None:
+        as_of = max(as_of, since)  # never move backwards
+    return as_of
+
+
+def _parse(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def read_token(token):
+    """(since, until, after) from a token; until and after are None at the start of a pass."""
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+        if isinstance(payload, str):  # issued before passes were paged
+            payload = {'since': payload}
+        since = _parse(payload['since']) if payload['since'] else None
+        until = after = None
+        if 'until' in payload:
+            until = _parse(payload['until'])
+            after = (_parse(payload['after'][0]), int(payload['after'][1]))
+    except (signing.BadSignature, KeyError, IndexError, TypeError, ValueError):
+        raise SyncTokenInvalid()
+    if since is not None and since < retention_horizon():
+        raise SyncTokenExpired()
+    return since, until, after
+
+
+def changed_products(since=None, after=None):
+    """Products changed after ``since`` (every product if None) and past ``after``, in pass order."""
+    products = Product.objects.order_by('updated_at', 'id')
+    if since is not None:
+        products = products.filter(updated_at__gt=since)
+    if after is not None:
+        updated_at, pk = after
+        products = products.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+    return products
+
+
+def deleted_since(since):
+    deleted = ProductTombstone.objects.filter(deleted_at__gt=since).values_list('product_id', flat=True)
+    return sorted(set(deleted))
+
+
+def compact_tombstones():
+    """Deletes tombstones older than the retention window; returns how many."""
+    deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=retention_horizon()).delete()
+    return deleted
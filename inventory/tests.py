@@ -1,3 +1,1150 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from users.authentication import tokens_for_user
+from users.models import DogProfile, OutboxEmail
+from users.outbox import drain_outbox
+
+from . import facets, typeahead
+from .batch import Dispatcher
+from .codes import (
+    CODE_BITS, CODE_MASK_FIELDS, CODES, compile_product_code, exact_segment_mask, matches, profile_codes,
+    stored_profile_codes,
+)
+from .models import (
+    MaterializedRecommendation, Order, OrderItem, Product, ProductTombstone, RecommendationSignature, StockHistory,
+)
+from .materialized import materialize_signature, rebuild
+from .orders import place_order
+from .stock import StockAdjustmentError, adjust_stock
+from .pagination import ProductPagination
+from .sync import encode_token
+from .recommendations import (
+    CATALOG_GENERATION_KEY, CatalogIndex, cache_stats, get_catalog, invalidate_catalog, recommendation_cache,
+)
+
+
+SEGMENT_CHOICES = [
+    ['PU', 'AD', 'SE', 'LI', 'PUAD', 'ADSE', 'XX'],
+    ['SM', 'ME', 'LA', 'GI', 'BS', 'SMME', 'LAGI'],
+    ['SH', 'LH', 'HY', 'CT', 'SHLH'],
+    ['WS', 'CO', 'LS', 'WSCO'],
+    ['NO', 'BR', 'JM', 'AS', 'NOBRJMAS', 'BRJM', 'ASNO'],
+]
+
+PROFILE_CHOICES = {
+    'life_stage': ['Puppy', 'adult ', 'SENIOR', 'Small', 'unknown'],
+    'size': ['Small', 'Medium', 'Large', 'Giant', ''],
+    'coat_type': ['Short-haired', 'Long-haired', 'Hypoallergenic', 'Curly'],
+    'role': ['Working / Service Dogs', 'Companion Dogs', 'Couch'],
+    'health_considerations': [
+        'None', 'Brachycephalic (Short-nosed)', 'Joint and Mobility Issues, Allergies and Sensitivities',
+        'Allergies and Sensitivities', 'Diabetes', '', 'None, Joint and Mobility Issues',
+    ],
+}
+
+
+def legacy_recommendations(products, dog):
+    """The original per-row matching loop of RecommendationView."""
+    life_stage, size, coat_type, role, health_codes = profile_codes(dog)
+    recommended = []
+    for product in products:
+        segments = product.product_code.upper().replace(' ', '').split('-')
+        if len(segments) < 5:
+            continue
+        if (
+            matches(life_stage, segments[0]) and
+            matches(size, segments[1]) and
+            matches(coat_type, segments[2]) and
+            matches(role, segments[3]) and
+            any(matches(hc, segments[4]) for hc in health_codes)
+        ):
+            recommended.append(product)
+    return recommended
+
+
+def make_product(product_code, **fields):
+    defaults = dict(
+        name=f'Product {product_code}', description='', quantity=10,
+        purchased_price='1.00', selling_price='2.00', date_purchased=date(2025, 1, 1),
+        supplier_name='Supplier', main_category='Food', sub_category='Dry',
+    )
+    defaults.update(fields)
+    return Product.objects.create(product_code=product_code, **defaults)
+
+
+IMPORT_ROW = dict(
+    name='Kibble', description='Dry food', quantity=12, purchased_price='5.00', selling_price='9.50',
+    date_purchased='2025-03-01', supplier_name='Acme', main_category='Food', sub_category='Dry',
+    product_code='AD-SM-SH-CO-NO',
+)
+
+IMPORT_CSV = (
+    'name,description,quantity,purchased_price,selling_price,date_purchased,supplier_name,'
+    'main_category,sub_category,product_code\n'
+    'Kibble,Dry food,12,5.00,9.50,2025-03-01,Acme,Food,Dry,AD-SM-SH-CO-NO\n'
+    'Bone,"Chew, large",-1,1.00,2.00,2025-03-01,Acme,Treat,Dental,AD-LA-SH-CO-NO\n'
+    'Shampoo,Mild,3,4.00,8.00,2025-03-01,Acme,Soap,Wet,AD-SM-SH-CO-NO\n'
+    'Brush,Soft,7,2.00,6.00,2025-03-01,Acme,Grooming,Pet Brush,LI-BS-CT-LS-NOBRJMAS\n'
+)
+
+
+def write_import_file(test, content, suffix):
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(handle, 'w') as stream:
+        stream.write(content)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+def random_catalog(rng, size=150):
+    products = []
+    for _ in range(size):
+        code = '-'.join(rng.choice(choices) for choices in SEGMENT_CHOICES)
+        if rng.random() < 0.05:
+            code = code.rsplit('-', 1)[0]  # malformed
+        products.append(make_product(code.lower() if rng.random() < 0.1 else code))
+    return products
+
+
+def random_profiles(rng, count=200):
+    return [
+        SimpleNamespace(**{field: rng.choice(values) for field, values in PROFILE_CHOICES.items()})
+        for _ in range(count)
+    ]
+
+
+class ProductCodeCompilationTests(TestCase):
+    def test_save_compiles_segments_with_wildcards_expanded(self):
+        product = make_product('pu-bs-ct-ls-no')
+        self.assertIsNotNone(product.health_mask)
+
+        dog = SimpleNamespace(life_stage='Puppy', size='Giant', coat_type='Long-haired',
+                              role='Companion Dogs', health_considerations='None')
+        self.assertEqual(list(Product.objects.recommended_for(profile_codes(dog))), [product])
+
+    def test_saved_profiles_store_their_codes(self):
+        rng = random.Random(7)
+        for index, dog in enumerate(random_profiles(rng, count=50)):
+            owner = get_user_model().objects.create(email=f'owner{index}@example.com')
+            profile = DogProfile.objects.create(owner=owner, name='Dog', gender='Male', **vars(dog))
+            *codes, health_codes = profile_codes(dog)
+            known = [code for code in CODES if code in health_codes]  # unknown health values are dropped
+            self.assertEqual(stored_profile_codes(profile), (*codes, known))
+            self.assertEqual(stored_profile_codes(DogProfile.objects.get(pk=profile.pk)), stored_profile_codes(profile))
+
+    def test_exact_masks_name_codes_not_substrings(self):
+        self.assertEqual(exact_segment_mask('JMAS'), CODE_BITS['JM'] | CODE_BITS['AS'])
+        self.assertEqual(exact_segment_mask('NOBRJMAS'), 0)
+        self.assertEqual(exact_segment_mask('LS'), 0)
+        self.assertEqual(exact_segment_mask('ASNO'), CODE_BITS['AS'] | CODE_BITS['NO'])
+        self.assertEqual(exact_segment_mask('OBRJ'), 0)  # BR straddles two codes
+
+    def test_malformed_code_is_never_recommended(self):
+        make_product('PU-BS-CT')
+        dog = SimpleNamespace(life_stage='?', size='?', coat_type='?', role='?', health_considerations='?')
+        self.assertFalse(Product.objects.recommended_for(profile_codes(dog)).exists())
+
+    def test_database_filter_matches_legacy_loop(self):
+        rng = random.Random(1234)
+        products = random_catalog(rng)
+        for dog in random_profiles(rng):
+            expected = {p.pk for p in legacy_recommendations(products, dog)}
+            actual = set(Product.objects.recommended_for(profile_codes(dog)).values_list('pk', flat=True))
+            self.assertEqual(actual, expected, vars(dog))
+
+
+class CatalogIndexTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+
+    def test_engine_matches_legacy_loop(self):
+        rng = random.Random(42)
+        products = random_catalog(rng)
+        catalog = CatalogIndex.from_database()
+        for dog in random_profiles(rng):
+            expected = sorted(p.pk for p in legacy_recommendations(products, dog))
+            self.assertEqual(catalog.match(profile_codes(dog)), expected, vars(dog))
+
+    def test_catalog_is_rebuilt_after_product_changes(self):
+        dog = SimpleNamespace(life_stage='Adult', size='Small', coat_type='Short-haired',
+                              role='Companion Dogs', health_considerations='None')
+        self.assertEqual(get_catalog().match(profile_codes(dog)), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product('AD-SM-SH-CO-NO')
+        self.assertEqual(get_catalog().match(profile_codes(dog)), [product.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(get_catalog().match(profile_codes(dog)), [])
+
+
+    def test_writes_in_other_processes_are_seen(self):
+        dog = SimpleNamespace(life_stage='Adult', size='Small', coat_type='Short-haired',
+                              role='Companion Dogs', health_considerations='None')
+        product = make_product('PU-SM-SH-CO-NO')
+        catalog = get_catalog()
+        self.assertEqual(catalog.match(profile_codes(dog)), [])
+
+        # Another worker saves the product: only the shared generation tells this one
+        Product.objects.filter(pk=product.pk).update(product_code='AD-SM-SH-CO-NO', life_stage_mask=CODE_BITS['AD'])
+        self.assertIs(get_catalog(), catalog)
+        caches['shared'].set(CATALOG_GENERATION_KEY, 'elsewhere')
+        self.assertEqual(get_catalog().match(profile_codes(dog)), [product.pk])
+
+    def test_edits_outside_the_code_keep_the_index(self):
+        product = make_product('AD-SM-SH-CO-NO')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=product.pk)
+        catalog = get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.quantity, product.selling_price = 3, '9.99'
+            product.save()
+        self.assertIs(get_catalog(), catalog)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.main_category = 'Grooming'
+            product.save()
+        self.assertIsNot(get_catalog(), catalog)
+
+
+class RecommendationCacheTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        recommendation_cache().clear()
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog = DogProfile.objects.create(
+                owner=self.user, name='Rex', gender='Male', life_stage='Adult', size='Small',
+                coat_type='Short-haired', role='Companion Dogs', health_considerations='None',
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('product-recommendations')
+
+    def recommended_ids(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_stats_count_materialized_and_live_results(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product('AD-SM-SH-CO-NO')
+        self.assertEqual(self.recommended_ids(), [product.pk])
+        self.assertEqual(self.recommended_ids(), [product.pk])
+
+        RecommendationSignature.objects.all().delete()
+        self.assertEqual(self.recommended_ids(), [product.pk])  # matched live
+        self.assertFalse(RecommendationSignature.objects.exists())  # and not written by the GET
+        self.assertEqual(cache_stats(), {
+            'hits': 2, 'misses': 1, 'hit_ratio': 0.6667, 'signature_hits': 2, 'signature_misses': 1,
+        })
+
+    def test_edits_outside_the_code_skip_the_rematch(self):
+        product = make_product('AD-SM-SH-CO-NO')
+        with mock.patch('inventory.signals.rematch_product') as rematch:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.quantity += 1
+                product.save()
+            rematch.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                product.product_code = 'PU-SM-SH-CO-NO'
+                product.save()
+            rematch.assert_called_once_with(product.pk)
+
+    def test_product_writes_update_materialized_matches(self):
+        self.assertEqual(self.recommended_ids(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product('AD-SM-SH-CO-NO')
+        self.assertEqual(self.recommended_ids(), [product.pk])
+
+    def test_profile_updates_invalidate_the_user_signature(self):
+        product = make_product('PU-SM-SH-CO-NO')
+        self.assertEqual(self.recommended_ids(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog.life_stage = 'Puppy'
+            self.dog.save()
+        self.assertEqual(self.recommended_ids(), [product.pk])
+
+
+class BatchRecommendationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.staff = User.objects.create_user(email='staff@example.com', password='pw', is_staff=True)
+        for index, life_stage in enumerate(['Adult', 'adult', 'Puppy']):
+            owner = User.objects.create_user(email=f'owner{index}@example.com', password='pw')
+            DogProfile.objects.create(
+                owner=owner, name='Dog', gender='Female', life_stage=life_stage, size='Small',
+                coat_type='Short-haired', role='Companion Dogs', health_considerations='None',
+            )
+        self.adult_food = make_product('AD-SM-SH-CO-NO')
+        self.any_food = make_product('LI-BS-CT-LS-NOBRJMAS')
+
+    def test_command_writes_one_line_per_profile(self):
+        out, err = StringIO(), StringIO()
+        call_command('recommend_all_profiles', stdout=out, stderr=err)
+        records = {r['email']: r for r in map(json.loads, out.getvalue().splitlines())}
+
+        self.assertEqual(set(records), {'owner0@example.com', 'owner1@example.com', 'owner2@example.com'})
+        self.assertEqual(records['owner0@example.com']['product_ids'], [self.adult_food.pk, self.any_food.pk])
+        self.assertEqual(records['owner0@example.com']['signature'], records['owner1@example.com']['signature'])
+        self.assertEqual(records['owner2@example.com']['product_ids'], [self.any_food.pk])
+        self.assertIn('2/2 profile signatures', err.getvalue())
+
+    def test_endpoint_is_staff_only_and_streams_jsonl(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.get(email='owner0@example.com'))
+        self.assertEqual(client.get(reverse('recommendation-batch')).status_code, 403)
+
+        client.force_authenticate(self.staff)
+        response = client.get(reverse('recommendation-batch'))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+
+class RankedRecommendationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        recommendation_cache().clear()
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='pw')
+        DogProfile.objects.create(
+            owner=self.user, name='Rex', gender='Male', life_stage='Adult', size='Small',
+            coat_type='Short-haired', role='Companion Dogs',
+            health_considerations='Joint and Mobility Issues, Allergies and Sensitivities',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_exact_and_multi_health_matches_rank_first(self):
+        wildcard = make_product('LI-BS-CT-LS-NOBRJMAS')
+        exact_one = make_product('AD-SM-SH-CO-JM')
+        exact_both = make_product('AD-SM-SH-CO-JMAS')
+        make_product('PU-SM-SH-CO-JMAS')  # no match
+
+        response = self.client.get(reverse('product-recommendations'), {'limit': 10})
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [exact_both.pk, exact_one.pk, wildcard.pk])
+        self.assertEqual([item['score'] for item in results], [12, 10, 6])  # wildcards never score as exact
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_pages_cover_the_full_ranking_once(self):
+        rng = random.Random(7)
+        random_catalog(rng, size=60)
+        codes = profile_codes(DogProfile.objects.get(owner=self.user))
+        catalog = get_catalog()
+        expected = sorted(catalog.scores(codes).items(), key=lambda item: (-item[1], catalog.ids[item[0]]))
+        expected = [catalog.ids[position] for position, score in expected]
+
+        seen, url, params = [], reverse('product-recommendations'), {'limit': 4}
+        while url:
+            response = self.client.get(url, params)
+            seen += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('product-recommendations'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MaterializedRecommendationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        rng = random.Random(99)
+        User = get_user_model()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = random_catalog(rng, size=80)
+            for index, dog in enumerate(random_profiles(rng, count=15)):
+                owner = User.objects.create(email=f'owner{index}@example.com')
+                DogProfile.objects.create(owner=owner, name='Dog', gender='Male', **vars(dog))
+
+    def assertConsistent(self):
+        call_command('check_recommendations', stdout=StringIO())
+
+    def test_incremental_maintenance_matches_live_matcher(self):
+        self.assertTrue(RecommendationSignature.objects.exists())
+        self.assertConsistent()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].product_code = 'LI-BS-CT-LS-NOBRJMAS'
+            self.products[0].save()
+            self.products[1].main_category = 'Grooming'
+            self.products[1].save()
+            self.products[2].delete()
+            make_product('SE-GI-HY-WS-BR')
+        self.assertConsistent()
+
+    def test_check_detects_and_repairs_drift(self):
+        MaterializedRecommendation.objects.filter(pk__in=MaterializedRecommendation.objects.values('pk')[:3]).delete()
+        with self.assertRaises(CommandError):
+            self.assertConsistent()
+        call_command('check_recommendations', '--fix', stdout=StringIO())
+        self.assertConsistent()
+
+    def test_rebuild(self):
+        MaterializedRecommendation.objects.all().delete()
+        call_command('rebuild_recommendations', stdout=StringIO())
+        self.assertConsistent()
+
+    def test_rebuild_catches_up_with_products_saved_during_the_pass(self):
+        build, product = CatalogIndex.from_database, self.products[0]
+
+        def build_then_save_elsewhere():
+            catalog = build()
+            # Another process's write, committed after the catalog was read
+            masks = compile_product_code('LI-BS-CT-LS-NOBRJMAS')
+            Product.objects.filter(pk=product.pk).update(
+                product_code='LI-BS-CT-LS-NOBRJMAS', main_category='Food', updated_at=timezone.now(),
+                **dict(zip(CODE_MASK_FIELDS, masks)),
+            )
+            return catalog
+
+        with mock.patch.object(CatalogIndex, 'from_database', build_then_save_elsewhere):
+            with self.captureOnCommitCallbacks(execute=True):
+                rebuild()
+        self.assertTrue(MaterializedRecommendation.objects.filter(product=product).exists())
+        self.assertConsistent()
+
+    def test_products_saved_while_a_signature_is_matched_are_kept(self):
+        signature = 'SE|GI|HY|WS|BR'
+        RecommendationSignature.objects.filter(signature=signature).delete()
+        catalog = CatalogIndex.from_database()
+        match = catalog.match
+        late = []
+
+        def match_while_another_process_saves(codes):
+            product_ids = match(codes)
+            with self.captureOnCommitCallbacks(execute=True):
+                late.append(make_product('SE-GI-HY-WS-BR'))
+            return product_ids
+
+        catalog.match = match_while_another_process_saves
+        materialize_signature(signature, catalog=catalog)
+        self.assertTrue(MaterializedRecommendation.objects.filter(signature=signature, product=late[0]).exists())
+
+    def test_bulk_import_is_materialized(self):
+        rows = ''.join(
+            json.dumps(dict(IMPORT_ROW, product_code=code)) + '\n'
+            for code in ['LI-BS-CT-LS-NOBRJMAS', 'PU-SM-SH-CO-NO', 'AD-LA']
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_products', write_import_file(self, rows, '.jsonl'), stdout=StringIO())
+        self.assertConsistent()
+
+
+class ProductPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        for index in range(25):
+            make_product('AD-SM-SH-CO-NO', name=f'Product {index}')
+        # Force ties on created_at so the id tiebreaker is exercised
+        Product.objects.filter(pk__in=Product.objects.order_by('pk').values('pk')[5:15]).update(
+            created_at=Product.objects.get(name='Product 5').created_at,
+        )
+
+    def test_pages_walk_the_catalog_once_in_order(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        seen, url, params = [], reverse('product-list'), {'page_size': 4}
+        while url:
+            response = self.client.get(url, params)
+            self.assertLessEqual(len(response.data['results']), 4)
+            seen += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(ProductPagination, 'max_page_size', 10):
+            response = self.client.get(reverse('product-list'), {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.product = make_product('AD-SM-SH-CO-NO')
+
+    def test_fields_and_omit(self):
+        response = self.client.get(reverse('product-list'), {'fields': 'name,selling_price'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'selling_price'})
+
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]), {'omit': 'description,id'})
+        self.assertNotIn('description', response.data)
+        self.assertIn('id', response.data)
+
+    def test_compact_list_view(self):
+        response = self.client.get(reverse('product-list'), {'view': 'compact'})
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'name', 'selling_price', 'quantity', 'main_category', 'sub_category', 'thumbnail'},
+        )
+
+    def test_unrequested_columns_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('product-list'), {'fields': 'name'})
+        select = next(query['sql'] for query in queries if 'FROM "inventory_product"' in query['sql'] and 'LIMIT' in query['sql'])
+        self.assertNotIn('"description"', select)
+        self.assertIn('"name"', select)
+
+    def test_fields_do_not_restrict_writes(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        response = self.client.patch(f'{url}?fields=name', {'quantity': 3}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('description', response.data)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.product = make_product('AD-SM-SH-CO-NO')
+
+    def assertRevalidates(self, url, last_modified=True):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual('Last-Modified' in response, last_modified)
+
+        with self.assertNumQueries(1):  # the validator aggregate only
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_list(self):
+        url = reverse('product-list')
+        etag = self.assertRevalidates(url, last_modified=False)
+        self.assertNotEqual(self.client.get(url, {'fields': 'name'})['ETag'], etag)
+
+        make_product('PU-SM-SH-CO-NO')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_deletes_are_not_answered_by_if_modified_since(self):
+        url = reverse('product-list')
+        make_product('PU-SM-SH-CO-NO')
+        self.product.delete()  # max(updated_at) is unchanged
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_detail(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        etag = self.assertRevalidates(url)
+        self.product.name = 'Renamed'
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('product-detail', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('product-detail', args=['abc'])).status_code, 404)
+
+    def test_history(self):
+        url = reverse('product-history', args=[self.product.pk])
+        etag = self.assertRevalidates(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotIn('COUNT(', queries.captured_queries[0]['sql'].upper())  # no scan of the history
+        StockHistory.objects.create(product=self.product, action='in', quantity_changed=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('product-history', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('product-history', args=['abc'])).status_code, 404)
+
+
+class StockHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.kibble = make_product('AD-SM-SH-CO-NO', name='Kibble')
+        self.bone = make_product('AD-SM-SH-CO-NO', name='Bone')
+        start = timezone.make_aware(datetime(2025, 3, 1, 12))
+        rows = []
+        for index in range(30):
+            product = self.kibble if index % 3 else self.bone
+            rows.append(StockHistory(product=product, action=('in', 'out', 'update')[index % 3], quantity_changed=index))
+        StockHistory.objects.bulk_create(rows)
+        # Pairs of rows share a timestamp, so the id breaks ties
+        for index, row in enumerate(StockHistory.objects.order_by('id')):
+            StockHistory.objects.filter(pk=row.pk).update(timestamp=start + timedelta(hours=index // 2 * 12))
+
+    def pages(self, url, params):
+        changes = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            changes.extend(response.data['results'])
+            url, params = response.data['next'], None
+        return changes
+
+    def expected(self, queryset):
+        return list(queryset.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def test_product_history_pages_newest_first(self):
+        url = reverse('product-history', args=[self.kibble.pk])
+        rows = self.pages(url, {'page_size': 4})
+        self.assertEqual([row['id'] for row in rows], self.expected(StockHistory.objects.filter(product=self.kibble)))
+        self.assertEqual({row['product_name'] for row in rows}, {'Kibble'})
+
+    def test_feed_covers_every_product(self):
+        rows = self.pages(reverse('product-history-feed'), {'page_size': 7})
+        self.assertEqual([row['id'] for row in rows], self.expected(StockHistory.objects.all()))
+        self.assertEqual({row['product_name'] for row in rows}, {'Kibble', 'Bone'})
+
+    def test_filters(self):
+        url = reverse('product-history-feed')
+        rows = self.pages(url, {'from': '2025-03-02', 'to': '2025-03-04', 'action': 'in,out'})
+        self.assertEqual([row['id'] for row in rows], self.expected(StockHistory.objects.filter(
+            timestamp__date__range=(date(2025, 3, 2), date(2025, 3, 4)), action__in=['in', 'out'],
+        )))
+        self.assertTrue(rows)
+        rows = self.pages(url, {'to': '2025-03-01T12:00:00Z'})
+        self.assertEqual(len(rows), 2)
+
+        for params in ({'from': 'yesterday'}, {'to': '2025-02-30'}, {'action': 'in,lost'}, {'cursor': 'x'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_names_are_fetched_once_per_page(self):
+        url = reverse('product-history-feed')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url, {'page_size': 30})
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(len(large), 2)  # the page and the names
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.url = reverse('product-changes')
+        self.kept = make_product('AD-SM-SH-CO-NO')
+        self.doomed = make_product('PU-SM-SH-CO-NO')
+
+    def sync(self, token=None):
+        return self.client.get(self.url, {'since': token} if token else {})
+
+    def test_full_then_incremental_sync(self):
+        response = self.sync()
+        self.assertEqual({item['id'] for item in response.data['changed']}, {self.kept.pk, self.doomed.pk})
+        self.assertEqual(response.data['deleted'], [])
+        self.assertIsNone(response.data['next'])
+        self.assertTrue(response.data['since'])
+
+        # Step outside the commit-skew window a fresh token would cover
+        Product.objects.update(updated_at=timezone.now() - timedelta(minutes=10))
+        token = encode_token(timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.sync(token).data['changed'], [])
+
+        self.kept.name = 'Renamed'
+        self.kept.save()
+        doomed_pk = self.doomed.pk
+        self.doomed.delete()
+
+        response = self.sync(token)
+        self.assertEqual([item['id'] for item in response.data['changed']], [self.kept.pk])
+        self.assertEqual(response.data['deleted'], [doomed_pk])
+
+    def test_passes_are_paged_until_caught_up(self):
+        products = [self.kept, self.doomed] + [make_product('AD-SM-SH-CO-NO') for _ in range(3)]
+        seen, url, params = [], self.url, {'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertLessEqual(len(response.data['changed']), 2)
+            seen += [item['id'] for item in response.data['changed']]
+            url, params = response.data['next'], None
+        self.assertEqual(seen, [product.pk for product in products])
+
+        # A write during the pass is picked up by the next sync
+        Product.objects.update(updated_at=timezone.now() - timedelta(minutes=10))
+        self.kept.save()
+        response = self.sync(response.data['since'])
+        self.assertEqual([item['id'] for item in response.data['changed']], [self.kept.pk])
+        self.assertIsNone(response.data['next'])
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.sync('tampered').status_code, 400)
+        with self.settings(TOMBSTONE_RETENTION_DAYS=1):
+            response = self.sync(encode_token(timezone.now() - timedelta(days=2)))
+        self.assertEqual(response.status_code, 410)
+
+    def test_compaction_drops_old_tombstones(self):
+        self.doomed.delete()
+        ProductTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=400))
+        call_command('compact_tombstones', stdout=StringIO())
+        self.assertFalse(ProductTombstone.objects.exists())
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.url = reverse('product-search')
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_ranked_by_field_weight(self):
+        in_description = make_product('AD-SM-SH-CO-NO', name='Kibble', description='Salmon recipe for adults')
+        in_name = make_product('AD-SM-SH-CO-NO', name='Salmon Kibble', description='Grain free')
+        make_product('AD-SM-SH-CO-NO', name='Chew toy', description='Rubber')
+
+        results = self.search('salmon').data['results']
+        self.assertEqual([item['id'] for item in results], [in_name.pk, in_description.pk])
+
+    def test_index_follows_updates_deletes_and_categories(self):
+        product = make_product('AD-SM-SH-CO-NO', name='Brush', supplier_name='Acme', sub_category='Pet Brush')
+        self.assertEqual(len(self.search('acme').data['results']), 1)
+        self.assertEqual(len(self.search('pet').data['results']), 1)
+
+        product.supplier_name = 'Globex'
+        product.save()
+        self.assertEqual(self.search('acme').data['results'], [])
+        self.assertEqual(len(self.search('glob').data['results']), 1)  # prefix match
+
+        product.delete()
+        self.assertEqual(self.search('globex').data['results'], [])
+
+    def test_paginates_and_tolerates_query_syntax(self):
+        for index in range(5):
+            make_product('AD-SM-SH-CO-NO', name=f'Treat {index}')
+        seen, url, params = [], self.url, {'q': 'treat', 'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            seen += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+        self.search('"treat AND OR (*')
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        typeahead.catalog_changed()  # drop whatever earlier tests left in this process
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kibble = make_product('AD-SM-SH-CO-NO', name='Grain-free Salmon Kibble', supplier_name='Acme Pet')
+            make_product('AD-SM-SH-CO-NO', name='Salmon Oil', supplier_name='Acme Pet')
+        typeahead.get_index()
+
+    def suggest(self, q):
+        response = self.client.get(reverse('product-suggest'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [(item['kind'], item['text']) for item in response.data]
+
+    def test_word_prefixes_without_queries(self):
+        with self.assertNumQueries(0):
+            suggestions = typeahead.suggest('SAL')
+        self.assertEqual([item['text'] for item in suggestions], ['Grain-free Salmon Kibble', 'Salmon Oil'])
+        self.assertEqual(self.suggest('acme'), [('supplier', 'Acme Pet')])
+
+    def test_incremental_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kibble.name = 'Duck Kibble'
+            self.kibble.save()
+        with self.assertNumQueries(0):
+            self.assertEqual([item['text'] for item in typeahead.suggest('kib')], ['Duck Kibble'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kibble.delete()
+        self.assertEqual(self.suggest('duck'), [])
+
+    def test_edits_outside_the_names_keep_the_generation(self):
+        generation = typeahead.current_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kibble.quantity += 1
+            self.kibble.save()
+        self.assertEqual(typeahead.current_generation(), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kibble.supplier_name = 'Bolt Supplies'
+            self.kibble.save()
+        self.assertNotEqual(typeahead.current_generation(), generation)
+        self.assertEqual(self.suggest('bolt'), [('supplier', 'Bolt Supplies')])
+
+    def test_stale_worker_rebuilds(self):
+        # Another worker's write: only the shared generation moves
+        Product.objects.filter(pk=self.kibble.pk).update(name='Venison Kibble')
+        caches['shared'].incr(typeahead.GENERATION_KEY)
+        self.assertEqual(self.suggest('veni'), [('product', 'Venison Kibble')])
+
+
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.dry = make_product('AD-SM-SH-CO-NO', main_category='Food', sub_category='Dry', selling_price='100.00')
+        self.wet = make_product('AD-SM-SH-CO-NO', main_category='Food', sub_category='Wet',
+                                selling_price='250.00', quantity=2)
+        self.toy = make_product('AD-SM-SH-CO-NO', main_category='Wellness', sub_category='Toys',
+                                selling_price='400.00')
+
+    def ids(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_filters(self):
+        self.assertEqual(self.ids(main_category='Food'), {self.dry.pk, self.wet.pk})
+        self.assertEqual(self.ids(sub_category='Wet,Toys'), {self.wet.pk, self.toy.pk})
+        self.assertEqual(self.ids(min_price='200', max_price='300'), {self.wet.pk})
+        self.assertEqual(self.ids(low_stock='true'), {self.wet.pk})
+        self.assertEqual(self.client.get(reverse('product-list'), {'min_price': 'cheap'}).status_code, 400)
+
+    def test_facets_are_cached_until_a_product_changes(self):
+        url = reverse('product-facets')
+        response = self.client.get(url)
+        self.assertEqual(response.data, {
+            'total': 3,
+            'main_category': {'Food': 2, 'Wellness': 1},
+            'sub_category': {'Dry': 1, 'Toys': 1, 'Wet': 1},
+        })
+        self.assertEqual(self.client.get(url, {'max_price': '300'}).data['total'], 2)
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.toy.delete()
+        self.assertEqual(self.client.get(url).data['main_category'], {'Food': 2})
+
+        # Another worker's write: only the shared generation moves
+        Product.objects.filter(pk=self.wet.pk).update(main_category='Wellness')
+        caches['shared'].set(facets.GENERATION_KEY, 'elsewhere')
+        self.assertEqual(self.client.get(url).data['main_category'], {'Food': 1, 'Wellness': 1})
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+
+    def upload(self, content, name, **data):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('product-bulk-import'), {'file': upload, **data}, format='multipart')
+
+    def test_csv_import_reports_bad_rows_and_keeps_the_rest(self):
+        response = self.upload(IMPORT_CSV, 'products.csv', chunk_size=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([(error['line'], set(error['errors'])) for error in response.data['errors']],
+                         [(3, {'quantity'}), (4, {'main_category'})])
+
+        kibble, brush = Product.objects.get(name='Kibble'), Product.objects.get(name='Brush')
+        self.assertIsNotNone(kibble.health_mask)
+        self.assertEqual(
+            sorted(StockHistory.objects.values_list('product__name', 'action', 'quantity_changed')),
+            [('Brush', 'in', 7), ('Kibble', 'in', 12)],
+        )
+        self.assertEqual(list(Product.objects.recommended_for(profile_codes(SimpleNamespace(
+            life_stage='Adult', size='Small', coat_type='Short-haired', role='Companion Dogs',
+            health_considerations='None',
+        ))).order_by('pk')), [kibble, brush])
+
+    def test_jsonl_import_in_chunks(self):
+        lines = [json.dumps(dict(IMPORT_ROW, name=f'Kibble {index}')) for index in range(7)]
+        lines[4:4] = ['', '{not json', '[1, 2]']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload('\n'.join(lines) + '\n', 'products.jsonl', chunk_size=3)
+        self.assertEqual((response.data['created'], response.data['failed']), (7, 2))
+        self.assertEqual([error['line'] for error in response.data['errors']], [6, 7])
+        self.assertEqual(StockHistory.objects.filter(action='in').count(), 7)
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2 * 3)  # products + history for each chunk of 3 rows
+
+    def test_chunk_size_is_bounded(self):
+        with self.settings(PRODUCT_IMPORT_MAX_CHUNK_SIZE=100):
+            for chunk_size in (101, -1):
+                response = self.upload(IMPORT_CSV, 'products.csv', chunk_size=chunk_size)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('chunk_size', response.data)
+            self.assertEqual(self.upload(IMPORT_CSV, 'products.csv', chunk_size=100).status_code, 201)
+
+    def test_rejects_unknown_file_types(self):
+        response = self.upload('{}', 'products.xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file', response.data)
+        self.assertEqual(self.upload(IMPORT_CSV.splitlines()[0], 'empty.csv').status_code, 400)
+
+    def test_management_command(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_products', write_import_file(self, IMPORT_CSV, '.csv'),
+                     stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 2 products, 2 rows failed.', stdout.getvalue())
+        self.assertIn('line 3:', stderr.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_products', '/nonexistent.csv', stdout=StringIO())
+
+
+class BulkStockAdjustmentTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create(email='manager@example.com'))
+        self.kibble = make_product('AD-SM-SH-CO-NO', quantity=10)
+        self.bone = make_product('AD-SM-SH-CO-NO', quantity=2)
+        self.url = reverse('product-bulk-adjust')
+
+    def adjust(self, adjustments):
+        return self.client.post(self.url, adjustments, format='json')
+
+    def quantities(self):
+        return dict(Product.objects.values_list('pk', 'quantity'))
+
+    def test_rows_are_locked_in_id_order_before_the_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            adjust_stock([{'product': self.bone.pk, 'delta': 1}, {'product': self.kibble.pk, 'delta': 1}])
+        statements = [query['sql'] for query in queries.captured_queries]
+        lock = next(index for index, sql in enumerate(statements) if sql.startswith('SELECT'))
+        update = next(index for index, sql in enumerate(statements) if sql.startswith('UPDATE'))
+        self.assertLess(lock, update)
+        self.assertIn('ORDER BY "inventory_product"."id" ASC', statements[lock])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', statements[lock])
+
+    def test_applies_all_deltas_with_one_update(self):
+        adjustments = [
+            {'product': self.kibble.pk, 'delta': 5},
+            {'product': self.bone.pk, 'delta': -2},
+            {'product': self.kibble.pk, 'delta': -1},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.adjust(adjustments)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.kibble.pk: 14, self.bone.pk: 0})
+        writes = [query['sql'].split()[0] for query in queries.captured_queries
+                  if query['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.assertEqual(writes, ['UPDATE', 'INSERT'])
+        self.assertEqual(
+            sorted(StockHistory.objects.values_list('product_id', 'action', 'quantity_changed')),
+            sorted([(self.kibble.pk, 'in', 4), (self.bone.pk, 'out', 2)]),
+        )
+
+    def test_rejects_the_whole_batch(self):
+        response = self.adjust([
+            {'product': self.kibble.pk, 'delta': -3},
+            {'product': self.bone.pk, 'delta': -5},
+            {'product': 9999, 'delta': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error['product'], error['error']) for error in response.data['errors']],
+            [(self.bone.pk, 'Insufficient stock.'), (9999, 'Product not found.')],
+        )
+        self.assertEqual(self.quantities(), {self.kibble.pk: 10, self.bone.pk: 2})
+        self.assertFalse(StockHistory.objects.exists())
+
+    def test_validation(self):
+        self.assertEqual(self.adjust([]).status_code, 400)
+        self.assertEqual(self.adjust([{'product': self.kibble.pk, 'delta': 0}]).status_code, 400)
+        self.assertEqual(self.adjust({'product': self.kibble.pk, 'delta': 1}).status_code, 400)
+
+    def test_invalidates_filtered_facets(self):
+        url = reverse('product-facets')
+        self.assertEqual(self.client.get(url, {'low_stock': 'true'}).data['total'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.adjust([{'product': self.kibble.pk, 'delta': -8}])
+        self.assertEqual(self.client.get(url, {'low_stock': 'true'}).data['total'], 2)
+
+
+class OrderCreateTests(TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create(email='customer@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.kibble = make_product('AD-SM-SH-CO-NO', name='Kibble', quantity=5)
+        self.bone = make_product('AD-SM-SH-CO-NO', name='Bone', quantity=1)
+
+    def order(self, *lines):
+        items = [{'product': product.pk, 'quantity': quantity} for product, quantity in lines]
+        return self.client.post(reverse('order-create'), {'items': items}, format='json')
+
+    def test_creates_order_items_history_and_email(self):
+        response = self.order((self.kibble, 2), (self.bone, 1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'], [
+            {'product': self.kibble.pk, 'quantity': 2}, {'product': self.bone.pk, 'quantity': 1},
+        ])
+        self.assertEqual(dict(Product.objects.values_list('name', 'quantity')), {'Kibble': 3, 'Bone': 0})
+        self.assertEqual(StockHistory.objects.filter(action='out').count(), 2)
+        self.assertEqual(mail.outbox, [])  # queued, not sent inside the request
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertIn('2 x Kibble', mail.outbox[0].body)
+
+    def test_failing_line_rolls_back_the_whole_order(self):
+        response = self.order((self.kibble, 2), (self.bone, 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ['Not enough stock for Bone'])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('name', 'quantity')), {'Kibble': 5, 'Bone': 1})
+        self.assertEqual(self.order((self.kibble, 0)).status_code, 400)
+
+    def test_stale_reads_cannot_oversell(self):
+        # Both checkouts validated while one Bone was left; only one may get it
+        first = place_order(self.customer, [{'product_id': self.bone.pk, 'quantity': 1}])
+        with self.assertRaises(StockAdjustmentError):
+            place_order(self.customer, [{'product_id': self.bone.pk, 'quantity': 1}])
+        self.assertEqual(list(Order.objects.all()), [first])
+        self.assertEqual(Product.objects.get(pk=self.bone.pk).quantity, 0)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        products = [make_product('AD-SM-SH-CO-NO', quantity=10) for _ in range(20)]
+        with CaptureQueriesContext(connection) as small:
+            self.order(*[(product, 1) for product in products[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self.order(*[(product, 1) for product in products])
+        self.assertEqual(len(small), len(large))
+
+
+@skipUnlessDBFeature('has_select_for_update')  # needs real row locking, not SQLite's database lock
+class ConcurrentOrderTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        customer = get_user_model().objects.create(email='customer@example.com')
+        product = make_product('AD-SM-SH-CO-NO', quantity=25)
+        outcomes = []
+
+        def checkout():
+            try:
+                for _ in range(10):
+                    try:
+                        place_order(customer, [{'product_id': product.pk, 'quantity': 1}])
+                        outcomes.append(True)
+                    except StockAdjustmentError:
+                        outcomes.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count(True), 25)
+        self.assertEqual(OrderItem.objects.count(), 25)
+        self.assertEqual(Product.objects.get(pk=product.pk).quantity, 0)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create(email='manager@example.com')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+        self.kibble = make_product('AD-SM-SH-CO-NO', name='Kibble', quantity=10)
+        self.bone = make_product('AD-SM-SH-CO-NO', name='Bone', quantity=2)
+
+    def batch(self, *requests, **options):
+        return self.client.post('/api/batch/', {'requests': list(requests), **options}, format='json')
+
+    def test_dispatches_in_order_and_returns_every_response(self):
+        product_url = f'/api/inventory/products/{self.kibble.pk}/'
+        response = self.batch(
+            {'method': 'GET', 'path': product_url},
+            {'method': 'POST', 'path': '/api/inventory/products/bulk-adjust/',
+             'body': [{'product': self.kibble.pk, 'delta': -3}]},
+            {'method': 'PATCH', 'path': product_url, 'body': {'name': 'Kibble XL'}},  # form-only view
+            {'method': 'GET', 'path': f'/api/inventory/products/{self.kibble.pk}/history/'},
+            {'method': 'GET', 'path': '/api/inventory/products/?fields=id,name&view=compact'},
+            {'method': 'GET', 'path': '/api/inventory/nothing-here/'},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data['responses']
+        self.assertEqual([result['status'] for result in results], [200, 200, 200, 200, 200, 404])
+        self.assertEqual(results[0]['body']['quantity'], 10)
+        self.assertIn('ETag', results[0]['headers'])
+        self.assertEqual(results[2]['body']['name'], 'Kibble XL')
+        self.assertEqual(results[2]['body']['quantity'], 7)
+        self.assertEqual([(entry['action'], entry['quantity_changed']) for entry in results[3]['body']['results']],
+                         [('out', 3)])
+        self.assertEqual(len(results[4]['body']['results']), 2)
+
+    def test_authenticates_once(self):
+        requests = [{'method': 'GET', 'path': f'/api/inventory/products/{self.bone.pk}/'}] * 5
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch(*requests)
+        self.assertEqual([result['status'] for result in response.data['responses']], [200] * 5)
+        self.assertEqual(len([query for query in queries if 'token_version' in query['sql']]), 1)
+
+        self.client.credentials()
+        self.assertEqual(self.batch(*requests).status_code, 401)
+
+    def test_rejects_bad_batches(self):
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch(*[{'method': 'GET', 'path': '/api/inventory/products/'}] * 3).status_code, 400)
+        self.assertEqual(self.batch().status_code, 400)
+        self.assertEqual(self.batch({'method': 'GET', 'path': '/admin/'}).status_code, 400)
+        self.assertEqual(self.batch({'method': 'TRACE', 'path': '/api/inventory/products/'}).status_code, 400)
+        nested = self.batch({'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}})
+        self.assertEqual(nested.data['responses'][0]['status'], 400)
+
+    def test_time_limit(self):
+        with self.settings(BATCH_TIME_LIMIT=0):
+            response = self.batch({'method': 'POST', 'path': '/api/inventory/products/bulk-adjust/',
+                                   'body': [{'product': self.kibble.pk, 'delta': -3}]})
+        self.assertEqual(response.data['responses'][0]['status'], 504)
+        self.assertEqual(Product.objects.get(pk=self.kibble.pk).quantity, 10)
+
+
+class ConcurrentBatchTests(TransactionTestCase):
+    def test_reads_run_concurrently_between_writes(self):
+        user = get_user_model().objects.create(email='manager@example.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+        products = [make_product('AD-SM-SH-CO-NO', quantity=10) for _ in range(4)]
+        reads = [{'method': 'GET', 'path': f'/api/inventory/products/{product.pk}/'} for product in products]
+        write = {'method': 'POST', 'path': '/api/inventory/products/bulk-adjust/',
+                 'body': [{'product': product.pk, 'delta': -1} for product in products]}
+
+        threads = set()
+        run = Dispatcher.run
+
+        def record_thread(dispatcher, subrequest):
+            threads.add(threading.get_ident())
+            return run(dispatcher, subrequest)
+
+        with mock.patch.object(Dispatcher, 'run', record_thread):
+            response = client.post('/api/batch/', {'requests': reads + [write] + reads, 'concurrent': True},
+                                   format='json')
+            client.post('/api/batch/', {'requests': reads, 'concurrent': True}, format='json')
+        results = response.data['responses']
+        self.assertEqual([result['status'] for result in results], [200] * 9)
+        self.assertEqual([result['body']['quantity'] for result in results[:4]], [10] * 4)
+        self.assertEqual([result['body']['quantity'] for result in results[5:]], [9] * 4)
+        self.assertGreater(len(threads), 1)
+        pool = [thread for thread in threading.enumerate() if thread.name.startswith('batch')]
+        self.assertLessEqual(len(pool), settings.BATCH_MAX_WORKERS)  # one pool, reused by every batch
@@ -0,0 +1,145 @@
+"""In-memory typeahead over product names and supplier names.
+
+Every word start of a name is a key in one sorted list, so a prefix lookup
+is a bisect plus a short forward scan, with no database access. Product
+writes that change a name or supplier name patch the list in place. Each
+such write also bumps a generation counter in the 'shared' cache alias,
+which every worker must see. A worker whose index is behind that counter
+(because another worker handled the write) rebuilds on its next lookup.
+"""
+import secrets
+import threading
+from bisect import bisect_left, insort
+
+from django.core.cache import caches
+
+from .models import Product
+
+GENERATION_KEY = 'typeahead:generation'
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def word_keys(text):
+    """The normalized text from each word onwards: 'Dog Food' -> ['dog food', 'food']."""
+    words = normalize(text).split(' ')
+    return [' '.join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+class PrefixIndex:
+    def __init__(self, rows=(), generation=0):
+        """Builds the index from (pk, name, supplier_name) rows."""
+        self.generation = generation
+        self.entries = []  # sorted (key, kind, text, pk)
+        self.by_product = {}
+        for pk, name, supplier_name in rows:
+            self.entries.extend(self._entries(pk, name, supplier_name))
+        self.entries.sort()
+
+    def _entries(self, pk, name, supplier_name):
+        entries = [
+            (key, kind, text, pk)
+            for kind, text in (('product', name), ('supplier', supplier_name)) if text
+            for key in word_keys(text)
+        ]
+        self.by_product[pk] = entries
+        return entries
+
+    def put(self, pk, name, supplier_name):
+        self.remove(pk)
+        for entry in self._entries(pk, name, supplier_name):
+            insort(self.entries, entry)
+
+    def remove(self, pk):
+        for entry in self.by_product.pop(pk, []):
+            index = bisect_left(self.entries, entry)
+            if index < len(self.entries) and self.entries[index] == entry:
+                del self.entries[index]
+
+    def suggest(self, prefix, limit=10):
+        """Distinct (kind, text, product id) suggestions whose words start with ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        suggestions, seen = [], set()
+        index = bisect_left(self.entries, (prefix,))
+        while index < len(self.entries) and len(suggestions) < limit:
+            key, kind, text, pk = self.entries[index]
+            if not key.startswith(prefix):
+                break
+            if (kind, text) not in seen:
+                seen.add((kind, text))
+                suggestions.append({'text': text, 'kind': kind, 'product': pk if kind == 'product' else None})
+            index += 1
+        return suggestions
+
+
+# ==========================
+# Per-process index kept in step with the shared generation
+# ==========================
+
+_lock = threading.Lock()
+_index = None
+
+
+def _fresh_generation():
+    # Random start: if the counter is evicted it cannot restart at a value
+    # that some worker's stale index already carries.
+    return secrets.randbits(48)
+
+
+def current_generation():
+    return caches['shared'].get_or_set(GENERATION_KEY, _fresh_generation, timeout=None)
+
+
+def _bump_generation():
+    cache = caches['shared']
+    cache.add(GENERATION_KEY, _fresh_generation(), timeout=None)
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:  # evicted between add() and incr()
+        generation = _fresh_generation()
+        cache.set(GENERATION_KEY, generation, timeout=None)
+        return generation
+
+
+def get_index():
+    global _index
+    generation = current_generation()
+    with _lock:
+        if _index is None or _index.generation != generation:
+            rows = Product.objects.values_list('pk', 'name', 'supplier_name').iterator(chunk_size=2000)
+            _index = PrefixIndex(rows, generation=generation)
+        return _index
+
+
+def suggest(prefix, limit=10):
+    index = get_index()
+    with _lock:
+        return index.suggest(prefix, limit)
+
+
+def product_saved(pk, name, supplier_name):
+    _apply(lambda index: index.put(pk, name, supplier_name))
+
+
+def product_deleted(pk):
+    _apply(lambda index: index.remove(pk))
+
+
+def catalog_changed():
+    """For writes that bypass model signals: every index rebuilds on next use."""
+    _bump_generation()
+
+
+def _apply(change):
+    global _index
+    generation = _bump_generation()
+    with _lock:
+        if _index is not None and _index.generation == generation - 1:
+            change(_index)
+            _index.generation = generation
+        else:
+            _index = None  # missed another worker's write; rebuild lazily
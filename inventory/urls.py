@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, RecommendationView, OrderCreateView
+from .views import (
+    ProductViewSet, RecommendationView, OrderCreateView,
+    recommendation_cache_stats, batch_recommendation_export,
+)
 
 router = DefaultRouter()
 router.register('products', ProductViewSet, basename='product')
@@ -8,5 +11,7 @@ router.register('products', ProductViewSet, basename='product')
 urlpatterns = [
     path('', include(router.urls)),
     path('recommendations/', RecommendationView.as_view(), name='product-recommendations'),
+    path('recommendations/stats/', recommendation_cache_stats, name='recommendation-cache-stats'),
+    path('recommendations/batch/', batch_recommendation_export, name='recommendation-batch'),
     path('order/create/', OrderCreateView.as_view(), name='order-create'),
 ]
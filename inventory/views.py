@@ -1,24 +1,206 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 from rest_framework import viewsets, generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.views import exception_handler
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.db.models import Q
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.http import StreamingHttpResponse
 
+from . import typeahead
+from .codes import CODE_MASK_FIELDS, stored_profile_codes
+from .facets import cached_facet_counts
+from .filters import ProductFilterBackend, StockHistoryFilterBackend
+from .importer import ImportFormatError, format_for, import_products, read_rows
+from .conditional import make_etag, not_modified, set_validators
+from .materialized import is_materialized, materialized_products
 from .models import Product, StockHistory, Order
-from .serializers import ProductSerializer, StockHistorySerializer, OrderSerializer
+from .pagination import ProductPagination, SearchPagination, StockHistoryPagination
+from .search import search_products
+from .stock import MAX_ADJUSTMENTS, StockAdjustmentError, adjust_stock
+from .recommendations import (
+    batch_recommendations, cache_stats, cached_user_signature, count_result, get_catalog, signature_codes,
+)
+from .sync import (
+    SyncTokenExpired, SyncTokenInvalid, changed_products, deleted_since, encode_token, read_token, sync_point,
+)
+from .serializers import (
+    ProductSerializer, ProductListSerializer, StockAdjustmentSerializer, StockHistorySerializer, OrderSerializer,
+)
+from users.authentication import ClaimsJWTAuthentication
 from users.models import DogProfile
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().order_by('-created_at')
+    queryset = Product.objects.all().order_by('-created_at', '-id')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = ProductPagination
+    filter_backends = [ProductFilterBackend]
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'changes', 'search') and self.request.query_params.get('view') == 'compact':
+            return ProductListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET' and self.action in ('list', 'retrieve', 'changes', 'search'):
+            queryset = queryset.only(*self.get_loaded_fields())
+        return queryset
+
+    def get_loaded_fields(self):
+        """Model columns the response actually reads, honouring ?fields= / ?omit=."""
+        serializer = self.get_serializer()
+        method_sources = getattr(serializer, 'method_field_sources', {})
+        names = {'id', *ProductPagination.ordering_fields()}
+        for name, field in serializer.fields.items():
+            names.update(method_sources.get(name, [field.source.split('.')[0]]))
+        return names & {field.name for field in Product._meta.concrete_fields}
+
+    def list(self, request, *args, **kwargs):
+        validators = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            last_modified=Max('updated_at'), count=Count('id'),
+        )
+        etag = make_etag(request, validators['last_modified'], validators['count'])
+        # No Last-Modified: deleting a product leaves max(updated_at) as it was, so
+        # If-Modified-Since would keep answering 304; the ETag covers the count
+        return self.conditional(request, etag, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            last_modified = Product.objects.filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            raise NotFound()
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        etag = make_etag(request, last_modified)
+        return self.conditional(request, etag, last_modified, super().retrieve, *args, **kwargs)
+
+    def conditional(self, request, etag, last_modified, handler, *args, **kwargs):
+        """Answers 304 from the validators alone, otherwise runs handler and tags its response."""
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = set_validators(handler(request, *args, **kwargs), etag, last_modified)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Products changed and deleted since ?since=<token>, one page at a time.
+
+        Without a token the pass covers the whole catalog. ``next`` links to
+        the following page until the client has caught up; ``since`` is the
+        token to resume with, and on the last page the one for the next sync.
+        """
+        since = until = after = None
+        token = request.query_params.get('since')
+        if token:
+            try:
+                since, until, after = read_token(token)
+            except SyncTokenExpired:
+                return Response(
+                    {'detail': 'Sync token expired; resync without ?since=.', 'code': 'resync_required'},
+                    status=status.HTTP_410_GONE,
+                )
+            except SyncTokenInvalid:
+                raise ValidationError({'since': 'Invalid sync token.'})
+        if until is None:
+            until = sync_point(since)  # taken before reading, so nothing falls in between
+
+        page_size = ProductPagination().get_page_size(request)
+        changed = changed_products(since, after).only(*self.get_loaded_fields(), 'updated_at')
+        page = list(changed[:page_size + 1])
+        deleted = deleted_since(since) if since is not None and after is None else []
+        if len(page) > page_size:
+            page = page[:page_size]
+            token = encode_token(since, until, (page[-1].updated_at, page[-1].pk))
+            next_link = replace_query_param(request.build_absolute_uri(), 'since', token)
+        else:
+            token, next_link = encode_token(until), None
+        return Response({
+            'changed': self.get_serializer(page, many=True).data,
+            'deleted': deleted,
+            'since': token,
+            'next': next_link,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Full-text search over name, description, supplier and categories, best match first."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This parameter is required.'})
+
+        paginator = SearchPagination()
+        queryset = search_products(text, self.filter_queryset(self.get_queryset()))
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        results = self.get_serializer(page, many=True).data
+        for item, product in zip(results, page):
+            item['rank'] = product.rank
+        return paginator.get_paginated_response(results)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Product counts per main and sub category, under the same filters as the list."""
+        params = {name: request.query_params.get(name) for name in ProductFilterBackend.filter_params}
+        queryset = self.filter_queryset(Product.objects.all())
+        return Response(cached_facet_counts(queryset, params))
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Typeahead over product and supplier names, served from memory."""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        return Response(typeahead.suggest(request.query_params.get('q', ''), limit))
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """Creates products from an uploaded .csv or .jsonl file; returns a per-row error report."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'This field is required.'})
+        try:
+            chunk_size = int(request.data.get('chunk_size') or 0) or None
+        except ValueError:
+            raise ValidationError({'chunk_size': 'Must be an integer.'})
+        if chunk_size is not None and not 1 <= chunk_size <= settings.PRODUCT_IMPORT_MAX_CHUNK_SIZE:
+            raise ValidationError({'chunk_size': f'Must be between 1 and {settings.PRODUCT_IMPORT_MAX_CHUNK_SIZE}.'})
+        try:
+            rows = read_rows(upload, format_for(upload.name))
+            report = import_products(rows, chunk_size=chunk_size)
+        except ImportFormatError as exc:
+            raise ValidationError({'file': str(exc)})
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'File must be UTF-8 encoded.'})
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk-adjust', parser_classes=[JSONParser])
+    def bulk_adjust(self, request):
+        """Applies [{product, delta}] stock changes in one transaction, all or nothing."""
+        serializer = StockAdjustmentSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=MAX_ADJUSTMENTS,
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            history = adjust_stock(serializer.validated_data)
+        except StockAdjustmentError as exc:
+            return Response({'detail': str(exc), 'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'adjusted': [
+                {'product': entry.product_id, 'action': entry.action, 'quantity_changed': entry.quantity_changed}
+                for entry in history
+            ],
+        })
 
     def perform_create(self, serializer):
         instance = serializer.save()
@@ -51,111 +233,142 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
-        product = self.get_object()
-        history = StockHistory.objects.filter(product=product).order_by('-timestamp')
-        serializer = StockHistorySerializer(history, many=True)
-        return Response(serializer.data)
+        # History is append-only, so its newest entry identifies it; one probe of
+        # stockhistory_product_time_idx instead of aggregating every entry
+        newest = StockHistory.objects.filter(product=OuterRef('pk')).order_by('-timestamp', '-id')[:1]
+        try:
+            validators = (
+                Product.objects.filter(pk=pk)
+                .annotate(newest_id=Subquery(newest.values('id')), newest_at=Subquery(newest.values('timestamp')))
+                .values('updated_at', 'newest_id', 'newest_at')
+                .first()
+            )
+        except (TypeError, ValueError):
+            raise NotFound()
+        if validators is None:
+            raise NotFound()
+        # Entries embed the product name, so product edits also invalidate the history
+        last_modified = max(filter(None, [validators['updated_at'], validators['newest_at']]))
+        etag = make_etag(request, validators['updated_at'], validators['newest_id'])
+        return self.conditional(request, etag, last_modified, self.list_history, pk=pk)
+
+    def list_history(self, request, pk=None):
+        return self.history_page(request, StockHistory.objects.filter(product_id=pk))
 
+    @action(detail=False, methods=['get'], url_path='history', url_name='history-feed')
+    def history_feed(self, request):
+        """Stock movements of every product, newest first; same filters and cursor as history."""
+        return self.history_page(request, StockHistory.objects.all())
 
-MAIN_CATEGORIES = ['Food', 'Treat', 'Health', 'Grooming', 'Wellness']
+    def history_page(self, request, queryset):
+        """One keyset page of ?from= / ?to= / ?action= filtered history, product names fetched once."""
+        paginator = StockHistoryPagination()
+        queryset = StockHistoryFilterBackend().filter_queryset(request, queryset, self)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        names = dict(Product.objects.filter(pk__in={row.product_id for row in page}).values_list('pk', 'name'))
+        serializer = StockHistorySerializer(page, many=True, context={'request': request, 'product_names': names})
+        return paginator.get_paginated_response(serializer.data)
 
 
 class RecommendationView(generics.ListAPIView):
+    """Recommended products for the user's dog.
+
+    Without parameters every match is returned. With ``?limit=`` and/or
+    ``?cursor=`` the matches are scored and returned best first, one page
+    at a time.
+    """
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+    default_limit = 20
+    max_limit = 100
 
-    def get_queryset(self):
-        try:
-            dog = DogProfile.objects.get(owner=self.request.user)
-
-            PROFILE_MAP = {
-                "PUPPY": "PU",
-                "ADULT": "AD",
-                "SENIOR": "SE",
-                "SMALL": "SM",
-                "MEDIUM": "ME",
-                "LARGE": "LA",
-                "GIANT": "GI",
-                "SHORT-HAIRED": "SH",
-                "LONG-HAIRED": "LH",
-                "HYPOALLERGENIC": "HY",
-                "WORKING / SERVICE DOGS": "WS",
-                "COMPANION DOGS": "CO",
-                "NONE": "NO",
-                "BRACHYCEPHALIC (SHORT-NOSED)": "BR",
-                "JOINT AND MOBILITY ISSUES": "JM",
-                "ALLERGIES AND SENSITIVITIES": "AS",
-            }
-
-            ALL_EQUIV = {
-                'PU': ['LI'],
-                'AD': ['LI'],
-                'SE': ['LI'],
-                'SH': ['CT'],
-                'LH': ['CT'],
-                'HY': ['CT'],
-                'WS': ['LS'],
-                'CO': ['LS'],
-                'LS': ['LS'],
-                'NO': ['NOBRJMAS'],
-                'BR': ['NOBRJMAS'],
-                'JM': ['NOBRJMAS'],
-                'AS': ['NOBRJMAS'],
-                'SM': ['BS'],
-                'ME': ['BS'],
-                'LA': ['BS'],
-                'GI': ['BS'],
-            }
-
-            # Map dog profile values to short codes
-            life_stage = PROFILE_MAP.get(dog.life_stage.upper().strip(), "")
-            size = PROFILE_MAP.get(dog.size.upper().strip(), "")
-            coat_type = PROFILE_MAP.get(dog.coat_type.upper().strip(), "")
-            role = PROFILE_MAP.get(dog.role.upper().strip(), "")
-            health_codes = [
-                PROFILE_MAP.get(h.strip().upper(), "") for h in dog.health_considerations.split(',') if h.strip()
-            ]
-
-            all_products = Product.objects.filter(main_category__in=MAIN_CATEGORIES)
-            recommended = []
-
-            def matches(value, segment, all_equiv):
-                if value in segment:
-                    return True
-                if segment in all_equiv.get(value, []):
-                    return True
-                if value in all_equiv:
-                    for alt in all_equiv[value]:
-                        if alt in segment:
-                            return True
-                return False
-
-            for product in all_products:
-                code = product.product_code.upper().replace(' ', '')
-                segments = code.split('-')
-                if len(segments) < 5:
-                    continue  # skip malformed codes
-
-                life_stage_seg = segments[0]
-                size_seg = segments[1]
-                coat_seg = segments[2]
-                role_seg = segments[3]
-                health_seg = segments[4]
-
-                if (
-                    matches(life_stage, life_stage_seg, ALL_EQUIV) and
-                    matches(size, size_seg, ALL_EQUIV) and
-                    matches(coat_type, coat_seg, ALL_EQUIV) and
-                    matches(role, role_seg, ALL_EQUIV) and
-                    any(matches(hc, health_seg, ALL_EQUIV) for hc in health_codes)
-                ):
-                    recommended.append(product)
-
-            return recommended
+    def get_signature(self):
+        def load_codes():
+            profile = DogProfile.objects.only(*CODE_MASK_FIELDS).get(owner_id=self.request.user.pk)
+            return stored_profile_codes(profile)
 
+        try:
+            return cached_user_signature(self.request.user.pk, load_codes)
         except DogProfile.DoesNotExist:
+            return None
+
+    def get_queryset(self):
+        signature = self.get_signature()
+        if signature is None:
             return Product.objects.none()
+
+        if is_materialized(signature):
+            count_result(materialized=True)
+            return materialized_products(signature).order_by('pk')
+        # Profiles written without signals, or before the table existed (see
+        # rebuild_recommendations): matched live, as a GET must not write
+        count_result(materialized=False)
+        return Product.objects.filter(pk__in=get_catalog().match(signature_codes(signature))).order_by('pk')
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if 'limit' not in params and 'cursor' not in params:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            limit = min(int(params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        if limit < 1:
+            raise ValidationError({'limit': 'Must be at least 1.'})
+        after = decode_rank_cursor(params['cursor']) if params.get('cursor') else None
+
+        page, cursor = ranked_recommendations(self.get_signature(), limit, after)
+        results = []
+        for product, score in page:
+            item = self.get_serializer(product).data
+            item['score'] = score
+            results.append(item)
+
+        next_url = None
+        if cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+        return Response({'next': next_url, 'results': results})
+
+
+def ranked_recommendations(signature, limit, after=None):
+    """One page of (product, score) for a signature, best first, and the cursor of the next page or None."""
+    ranked = get_catalog().rank(signature_codes(signature), limit, after) if signature else []
+    products = Product.objects.in_bulk([pk for pk, score in ranked])
+    page = [(products[pk], score) for pk, score in ranked if pk in products]  # skip products deleted since
+    cursor = None
+    if len(ranked) == limit:
+        last_pk, last_score = ranked[-1]
+        cursor = encode_rank_cursor(last_score, last_pk)
+    return page, cursor
+
+
+def encode_rank_cursor(score, pk):
+    return urlsafe_b64encode(f"{score}:{pk}".encode()).decode()
+
+
+def decode_rank_cursor(cursor):
+    try:
+        score, pk = urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(score), int(pk)
+    except (ValueError, UnicodeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def recommendation_cache_stats(request):
+    return Response(cache_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def batch_recommendation_export(request):
+    lines = (json.dumps(record) + '\n' for record in batch_recommendations())
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
 # ============================
 # Custom Exception Handler
 # ============================
@@ -172,4 +385,4 @@ def custom_exception_handler(exc, context):
 class OrderCreateView(generics.CreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
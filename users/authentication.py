@@ -0,0 +1,145 @@
+"""JWT authentication from token claims, without loading the user row.
+
+Tokens issued by LoginView and the JWT create endpoint carry the user's
+email, role, verification and staff flags, plus ``ver``, the user's
+token_version. ClaimsJWTAuthentication builds request.user from those claims.
+The only database read is the current token_version, cached per process for
+TOKEN_VERSION_CACHE_SECONDS, so a user costs at most one query per process
+per interval. revoke_tokens() bumps the version, which invalidates every
+token issued before it: at once in this process and within the cache
+interval in others.
+
+Views that need the full CustomUser row (e.g. to save it) use
+VersionedJWTAuthentication, the default authentication class, which loads
+the row and compares ``ver`` against it. The refresh endpoint refuses
+refresh tokens with a stale ``ver`` too. Tokens issued before ``ver``
+existed count as version 0.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+VERSION_CLAIM = 'ver'
+
+# Bound on the per-process version cache; expired entries are dropped past it
+MAX_CACHED_VERSIONS = 10000
+
+_lock = threading.Lock()
+_versions = {}  # user id -> (token_version or None if inactive/deleted, expires at)
+
+
+def add_user_claims(token, user):
+    token['email'] = user.email
+    token['role'] = user.role
+    token['is_verified'] = user.is_verified
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+def tokens_for_user(user):
+    """A refresh token with the user claims; its .access_token carries them too."""
+    return add_user_claims(RefreshToken.for_user(user), user)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens issued before the user's last revoke_tokens()."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        version = User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+        if version is not None and refresh.payload.get(VERSION_CLAIM, 0) != version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return super().validate(attrs)
+
+
+def current_token_version(user_id):
+    """The user's token_version, or None if the user is inactive or gone; cached per process."""
+    now = time.monotonic()
+    with _lock:
+        entry = _versions.get(user_id)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    version = User.objects.filter(pk=user_id, is_active=True).values_list('token_version', flat=True).first()
+    with _lock:
+        if len(_versions) >= MAX_CACHED_VERSIONS:
+            for stale in [key for key, (_, expires) in _versions.items() if expires <= now]:
+                del _versions[stale]
+        _versions[user_id] = (version, now + settings.TOKEN_VERSION_CACHE_SECONDS)
+    return version
+
+
+def forget_token_version(user_id):
+    with _lock:
+        _versions.pop(user_id, None)
+
+
+def revoke_tokens(user):
+    """Invalidates every token issued to the user so far."""
+    User.objects.filter(pk=user.pk).update(token_version=F('token_version') + 1)
+    forget_token_version(user.pk)
+
+
+class ClaimsUser(TokenUser):
+    """request.user built from token claims; it is not a CustomUser and cannot be saved."""
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', '')
+
+    @cached_property
+    def is_verified(self):
+        return self.token.get('is_verified', False)
+
+
+class VersionedJWTAuthentication(JWTAuthentication):
+    """simplejwt's authentication (request.user is the CustomUser row) plus the ``ver`` check."""
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if validated_token.get(VERSION_CLAIM, 0) != user.token_version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return user
+
+
+class ClaimsJWTAuthentication(VersionedJWTAuthentication):
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)  # issued before claims were added
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        version = current_token_version(user_id)
+        if version is None:
+            raise AuthenticationFailed("User not found or inactive", code="user_not_found")
+        if version != validated_token[VERSION_CLAIM]:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return ClaimsUser(validated_token)
@@ -4,10 +4,26 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 class EmailBackend(ModelBackend):
-    def authenticate(self, request, email=None, password=None, **kwargs):
+    """The only authentication backend: one indexed lookup and one password hash per attempt.
+
+    Unknown emails still run the hasher once, so response time does not tell
+    registered addresses apart. A successful check_password() re-encodes the
+    password when PASSWORD_HASHERS prefers a different hasher or more
+    iterations, so hashes are upgraded on login.
+
+    Inactive (not yet verified) users are returned, as before; LoginSerializer
+    turns them away with a "verify your email" message.
+    """
+
+    def authenticate(self, request, email=None, password=None, username=None, **kwargs):
+        email = email or username or kwargs.get(User.USERNAME_FIELD)
+        if email is None or password is None:
+            return None
         try:
-            user = User.objects.get(email=email)
-            if user.check_password(password):
-                return user
+            user = User._default_manager.get_by_natural_key(email)
         except User.DoesNotExist:
+            User().set_password(password)  # equalise timing with a real check
             return None
+        if user.check_password(password):
+            return user
+        return None
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+User = get_user_model()
+
+PASSWORD = 'benchmark-password'
+
+
+class Rollback(Exception):
+    pass
+
+
+class LegacyEmailBackend(ModelBackend):
+    """The previous users.backends.EmailBackend, listed after ModelBackend."""
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        try:
+            user = User.objects.get(email=email)
+            if user.check_password(password):
+                return user
+        except User.DoesNotExist:
+            return None
+
+
+class Command(BaseCommand):
+    help = "Measures authenticate() latency (p50/p99) for success, wrong password and unknown user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        configurations = [
+            ('legacy', ['django.contrib.auth.backends.ModelBackend',
+                        'users.management.commands.benchmark_login.LegacyEmailBackend']),
+            ('single-pass', ['users.backends.EmailBackend']),
+        ]
+        cases = [
+            ('success', 'benchmark@example.com', PASSWORD),
+            ('wrong password', 'benchmark@example.com', 'not-the-password'),
+            ('unknown user', 'nobody@example.com', PASSWORD),
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.create_user(email='benchmark@example.com', password=PASSWORD, is_verified=True)
+                for label, backends in configurations:
+                    with override_settings(AUTHENTICATION_BACKENDS=backends):
+                        for case, email, password in cases:
+                            self.measure(f"{label} / {case}", email, password, options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, label, email, password, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            authenticate(email=email, password=password)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(f"{label:32} p50 {percentiles[49]:8.1f} ms   p99 {percentiles[98]:8.1f} ms")
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import EmailVerification
+
+
+class Command(BaseCommand):
+    help = "Deletes EmailVerification rows older than OTP_TTL (codes now live in the 'otp' cache)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Delete every row, live or not.")
+
+    def handle(self, *args, **options):
+        rows = EmailVerification.objects.all()
+        if not options['all']:
+            rows = rows.filter(created_at__lt=timezone.now() - timedelta(seconds=settings.OTP_TTL))
+        count, _ = rows.delete()
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} verification codes."))
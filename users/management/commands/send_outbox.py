@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Sends queued outbox emails in batches over one SMTP connection; --loop keeps polling."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Messages per batch (OUTBOX_BATCH_SIZE).")
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting once drained.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain_outbox(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
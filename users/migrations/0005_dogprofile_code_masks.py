@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dogprofile',
+            name='coat_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dogprofile',
+            name='health_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dogprofile',
+            name='life_stage_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dogprofile',
+            name='role_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dogprofile',
+            name='size_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from inventory.codes import CODE_MASK_FIELDS, profile_masks
+
+
+def backfill_code_masks(apps, schema_editor):
+    DogProfile = apps.get_model('users', 'DogProfile')
+    fields = ('id', 'life_stage', 'size', 'coat_type', 'role', 'health_considerations')
+    batch = []
+    for dog in DogProfile.objects.only(*fields).iterator(chunk_size=500):
+        for field, mask in zip(CODE_MASK_FIELDS, profile_masks(dog)):
+            setattr(dog, field, mask)
+        batch.append(dog)
+        if len(batch) >= 500:
+            DogProfile.objects.bulk_update(batch, CODE_MASK_FIELDS)
+            batch = []
+    if batch:
+        DogProfile.objects.bulk_update(batch, CODE_MASK_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_dogprofile_code_masks'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_code_masks, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 import random
 import string
 
+from inventory.codes import CODE_MASK_FIELDS, PROFILE_FIELD_CODES, profile_masks
+
 # ========================
 # User Manager
 # ========================
@@ -38,6 +41,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
 
+    # Copied into issued JWTs; bumping it revokes them (users.authentication)
+    token_version = models.PositiveIntegerField(default=0)
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
@@ -59,9 +65,27 @@ class DogProfile(models.Model):
     role = models.CharField(max_length=50)  # Add this
     health_considerations = models.TextField(blank=True)
 
+    # The values above compiled per dimension (see inventory.codes); 0 if unspecified
+    life_stage_mask = models.PositiveIntegerField(default=0, editable=False)
+    size_mask = models.PositiveIntegerField(default=0, editable=False)
+    coat_mask = models.PositiveIntegerField(default=0, editable=False)
+    role_mask = models.PositiveIntegerField(default=0, editable=False)
+    health_mask = models.PositiveIntegerField(default=0, editable=False)
+
     def __str__(self):
         return f"{self.owner.email}'s dog - {self.name}"
 
+    def compile_codes(self):
+        for field, mask in zip(CODE_MASK_FIELDS, profile_masks(self)):
+            setattr(self, field, mask)
+
+    def save(self, *args, **kwargs):
+        self.compile_codes()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not PROFILE_FIELD_CODES.keys().isdisjoint(update_fields):
+            kwargs['update_fields'] = {*update_fields, *CODE_MASK_FIELDS}
+        super().save(*args, **kwargs)
+
 # ========================
 # Email Verification Model (OTP)
 # ========================
@@ -76,3 +100,33 @@ class EmailVerification(models.Model):
 
     def __str__(self):
         return f"{self.user.email} - {self.purpose} - {self.code}"
+
+# ========================
+# Outbound Email (Outbox)
+# ========================
+class OutboxEmail(models.Model):
+    """An email queued in the same transaction as the change it reports; see users.outbox."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "due messages" scan
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
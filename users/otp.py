@@ -0,0 +1,87 @@
+"""One-time verification codes kept in the 'otp' cache.
+
+A code lives under one key per (user, purpose) with a TTL of OTP_TTL
+seconds; issuing a new code replaces the previous one. Only an HMAC of the
+code is stored and checks compare digests in constant time. Every check
+counts against OTP_MAX_ATTEMPTS, after which the code is revoked.
+
+With OTP_DB_FALLBACK on, codes are also written to EmailVerification and
+read from there when the cache has lost them (restart, eviction). Otherwise
+that table is never touched.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import EmailVerification
+from .utils import generate_code
+
+KEY = 'otp:{purpose}:{user_id}'
+
+
+def otp_cache():
+    return caches['otp']
+
+
+def _digest(user_id, purpose, code):
+    return salted_hmac('users.otp', f'{user_id}:{purpose}:{code.strip().upper()}').hexdigest()
+
+
+def _keys(user_id, purpose):
+    key = KEY.format(purpose=purpose, user_id=user_id)
+    return key, f'{key}:attempts'
+
+
+def issue_code(user, purpose):
+    """Creates a fresh code for the user and purpose and returns it in clear, for the email."""
+    code = generate_code()
+    key, attempts_key = _keys(user.pk, purpose)
+    otp_cache().set(key, _digest(user.pk, purpose, code), timeout=settings.OTP_TTL)
+    otp_cache().delete(attempts_key)
+    if settings.OTP_DB_FALLBACK:
+        EmailVerification.objects.filter(user=user, purpose=purpose).delete()
+        EmailVerification.objects.create(user=user, purpose=purpose, code=code)
+    return code
+
+
+def verify_code(user, purpose, code, consume=True):
+    """True if ``code`` is the user's live code for ``purpose``; a match is revoked unless consume=False."""
+    key, attempts_key = _keys(user.pk, purpose)
+    cache = otp_cache()
+    cache.add(attempts_key, 0, timeout=settings.OTP_TTL)
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:  # evicted between add() and incr()
+        attempts = 1
+    if attempts > settings.OTP_MAX_ATTEMPTS:
+        revoke_code(user, purpose)
+        return False
+
+    digest = cache.get(key)
+    if digest is None and settings.OTP_DB_FALLBACK:
+        digest = _stored_digest(user, purpose)
+    if digest is None or not constant_time_compare(digest, _digest(user.pk, purpose, code)):
+        return False
+    if consume:
+        revoke_code(user, purpose)
+    return True
+
+
+def revoke_code(user, purpose):
+    otp_cache().delete_many(_keys(user.pk, purpose))
+    if settings.OTP_DB_FALLBACK:
+        EmailVerification.objects.filter(user=user, purpose=purpose).delete()
+
+
+def _stored_digest(user, purpose):
+    code = (
+        EmailVerification.objects
+        .filter(user=user, purpose=purpose, created_at__gte=timezone.now() - timedelta(seconds=settings.OTP_TTL))
+        .order_by('-created_at')
+        .values_list('code', flat=True)
+        .first()
+    )
+    return _digest(user.pk, purpose, code) if code else None
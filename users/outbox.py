@@ -0,0 +1,123 @@
+"""Durable outbound email.
+
+``enqueue_mail`` stores a message in OutboxEmail as part of the caller's
+transaction, so the email goes out if and only if the change it reports is
+committed. The ``send_outbox`` worker drains due messages in batches over a
+single SMTP connection, which a refused message leaves open and only a lost
+connection replaces. Failed messages are retried with exponential backoff
+until OUTBOX_MAX_ATTEMPTS, then marked failed.
+"""
+import random
+from contextlib import suppress
+from datetime import timedelta
+from smtplib import SMTPException, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+# A claimed message is offered again after this long if its worker dies mid-send
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None):
+    """Queues an email; call it inside the transaction that makes the change."""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def claim_batch(batch_size):
+    """Due messages, leased to this worker; concurrent workers skip the locked rows."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=now + CLAIM_TIMEOUT,
+        )
+    return batch
+
+
+def retry_delay(attempts):
+    """Exponential backoff with up to 10% jitter, so failed batches do not retry in lockstep."""
+    delay = settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * (1 + random.random() / 10))
+
+
+def connection_lost(exc):
+    """True if the SMTP session is unusable after ``exc``, as opposed to one message being refused."""
+    return isinstance(exc, SMTPServerDisconnected) or (isinstance(exc, OSError) and not isinstance(exc, SMTPException))
+
+
+def send_batch(batch, connection):
+    """Sends claimed messages over an open connection; returns (sent, failed) counts."""
+    sent, failed = [], []
+    for email in batch:
+        message = EmailMessage(email.subject, email.body, email.from_email, email.recipients)
+        try:
+            connection.send_messages([message])
+        except Exception as exc:  # SMTP, socket and backend errors alike
+            failed.append((email, exc))
+            if connection_lost(exc):
+                with suppress(Exception):
+                    connection.close()
+                with suppress(Exception):
+                    connection.open()  # shared by the rest of the drain; if it fails, the next send retries
+        else:
+            sent.append(email.pk)
+
+    now = timezone.now()
+    OutboxEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=now, attempts=F('attempts') + 1)
+    record_failures(failed, now)
+    return len(sent), len(failed)
+
+
+def record_failures(failed, now):
+    for email, exc in failed:
+        email.attempts += 1
+        email.last_error = f'{type(exc).__name__}: {exc}'
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.status = 'failed'
+        else:
+            email.next_attempt_at = now + retry_delay(email.attempts)
+    OutboxEmail.objects.bulk_update(
+        [email for email, _ in failed], ['status', 'attempts', 'last_error', 'next_attempt_at'],
+    )
+
+
+def drain_outbox(batch_size=None, connection=None):
+    """Sends every due message over one connection; returns (sent, failed) counts."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0  # no connection opened while idle
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        record_failures([(email, exc) for email in batch], timezone.now())
+        return 0, len(batch)
+
+    total_sent = total_failed = 0
+    try:
+        while batch:
+            sent, failed = send_batch(batch, connection)
+            total_sent += sent
+            total_failed += failed
+            batch = claim_batch(batch_size)  # retried messages are not due again yet
+    finally:
+        with suppress(Exception):
+            connection.close()
+    return total_sent, total_failed
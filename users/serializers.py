@@ -4,6 +4,8 @@ from djoser.serializers import TokenCreateSerializer
 from rest_framework.exceptions import ValidationError
 from user_agents import parse as parse_ua
 
+from inventory.codes import clean_profile_value
+
 from .models import DogProfile, EmailVerification, CustomUser
 from .utils import generate_code, send_verification_email
 
@@ -132,3 +134,25 @@ class DogProfileSerializer(serializers.ModelSerializer):
             'lifestyle',  # ✅ now allowed through aliasing
             'health_considerations'
         ]
+
+    # Unknown values would never match a product code, so they are refused here
+    def validate_profile_value(self, field, value):
+        try:
+            return clean_profile_value(field, value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def validate_life_stage(self, value):
+        return self.validate_profile_value('life_stage', value)
+
+    def validate_size(self, value):
+        return self.validate_profile_value('size', value)
+
+    def validate_coat_type(self, value):
+        return self.validate_profile_value('coat_type', value)
+
+    def validate_lifestyle(self, value):
+        return self.validate_profile_value('role', value)
+
+    def validate_health_considerations(self, value):
+        return self.validate_profile_value('health_considerations', value)
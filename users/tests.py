@@ -1,3 +1,535 @@
-from django.test import TestCase
+import re
+import threading
+import time
+from importlib import import_module
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException, SMTPServerDisconnected
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import MD5PasswordHasher, make_password
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from inventory.codes import CODE_MASK_FIELDS, stored_profile_codes
+from inventory.models import Order, Product
+from inventory.recommendations import get_catalog, invalidate_catalog
+from inventory.views import ProductViewSet
+
+from .authentication import ClaimsJWTAuthentication, forget_token_version, revoke_tokens, tokens_for_user
+from .models import CustomUser, DogProfile, EmailVerification, OutboxEmail
+from .otp import issue_code, otp_cache, verify_code
+from .outbox import drain_outbox, enqueue_mail
+from .throttling import reset_throttles, take_token, throttle_stats
+
+CODE_PATTERN = re.compile(r'Your code is: ([A-Z0-9]{5})')
+
+
+class FlakyBackend(LocmemBackend):
+    """Locmem backend that refuses recipients at @bounce.test and counts connections.
+
+    Like the SMTP backend, a send without an open connection opens one of its own
+    and closes it again. @drop.test recipients drop the connection.
+    """
+    opened = 0
+    connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        FlakyBackend.opened += 1
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        try:
+            addresses = [address for message in messages for address in message.to]
+            if any(address.endswith('@drop.test') for address in addresses):
+                self.connected = False
+                raise SMTPServerDisconnected('connection unexpectedly closed')
+            if any(address.endswith('@bounce.test') for address in addresses):
+                raise SMTPException('mailbox unavailable')
+            return super().send_messages(messages)
+        finally:
+            if new_connection:
+                self.close()
+
+
+class CountingHasher(MD5PasswordHasher):
+    algorithm = 'counting_md5'
+    calls = 0
+
+    def encode(self, password, salt):
+        CountingHasher.calls += 1
+        return super().encode(password, salt)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+    })
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        reset_throttles()
+        FlakyBackend.opened = 0
+
+    def test_requests_queue_mail_and_the_worker_sends_it(self):
+        client = APIClient()
+        response = client.post(reverse('register'), {'email': 'new@example.com', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 201)
+        client.post(reverse('send-code'), {'email': 'new@example.com', 'purpose': 'reset'})
+        client.post(reverse('resend-code'), {'email': 'new@example.com', 'purpose': 'reset'})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboxEmail.objects.filter(status='pending').count(), 3)
+
+        stdout = StringIO()
+        call_command('send_outbox', stdout=stdout)
+        self.assertIn('Sent 3 emails, 0 failed.', stdout.getvalue())
+        self.assertEqual([message.to for message in mail.outbox], [['new@example.com']] * 3)
+        self.assertTrue(all(CODE_PATTERN.search(message.body) for message in mail.outbox))
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    def test_failed_registration_queues_nothing(self):
+        CustomUser.objects.create(email='taken@example.com')
+        response = APIClient().post(reverse('register'), {'email': 'taken@example.com', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    @override_settings(EMAIL_BACKEND='users.tests.FlakyBackend', OUTBOX_MAX_ATTEMPTS=2)
+    def test_batches_share_one_connection_and_failures_back_off(self):
+        for index in range(5):
+            enqueue_mail('Hi', 'Body', [f'user{index}@example.com'])
+            if index == 1:
+                bounce = enqueue_mail('Hi', 'Body', ['user@bounce.test'])
+
+        self.assertEqual(drain_outbox(batch_size=2), (5, 1))
+        self.assertEqual(FlakyBackend.opened, 1)  # three batches and a refusal, one connection
+        self.assertEqual(len(mail.outbox), 5)
+        bounce.refresh_from_db()
+        self.assertEqual((bounce.status, bounce.attempts), ('pending', 1))
+        self.assertIn('mailbox unavailable', bounce.last_error)
+        self.assertGreater(bounce.next_attempt_at, timezone.now())
+
+        self.assertEqual(drain_outbox(), (0, 0))  # not due yet
+        OutboxEmail.objects.filter(pk=bounce.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(drain_outbox(), (0, 1))
+        bounce.refresh_from_db()
+        self.assertEqual((bounce.status, bounce.attempts), ('failed', 2))
+
+    @override_settings(EMAIL_BACKEND='users.tests.FlakyBackend')
+    def test_a_dropped_connection_is_replaced_once(self):
+        enqueue_mail('Hi', 'Body', ['user@drop.test'])
+        for index in range(3):
+            enqueue_mail('Hi', 'Body', [f'user{index}@example.com'])
+        self.assertEqual(drain_outbox(), (3, 1))
+        self.assertEqual(FlakyBackend.opened, 2)
+
+
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        otp_cache().clear()
+        reset_throttles()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(email='dog@example.com', password='secret123', is_active=False)
+
+    def emailed_code(self):
+        drain_outbox()
+        return CODE_PATTERN.search(mail.outbox[-1].body).group(1)
+
+    def test_register_flow_never_touches_the_verification_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('send-code'), {'email': self.user.email, 'purpose': 'register'})
+            code = self.emailed_code()
+            wrong = self.client.post(reverse('verify-code'), {'email': self.user.email, 'code': 'XXXXX',
+                                                              'purpose': 'register'})
+            right = self.client.post(reverse('verify-code'), {'email': self.user.email, 'code': code,
+                                                              'purpose': 'register'})
+        self.assertEqual((wrong.status_code, right.status_code), (400, 200))
+        self.assertFalse([query for query in queries.captured_queries if 'emailverification' in query['sql']])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+        self.assertFalse(verify_code(self.user, 'register', code))  # consumed
+
+    def test_reset_code_survives_verification_until_used(self):
+        self.client.post(reverse('resend-code'), {'email': self.user.email, 'purpose': 'reset'})
+        code = self.emailed_code()
+        data = {'email': self.user.email, 'code': code, 'purpose': 'reset'}
+        self.assertEqual(self.client.post(reverse('verify-code'), data).status_code, 200)
+        response = self.client.post(reverse('reset-password'), {**data, 'new_password': 'better456'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('better456'))
+        self.assertEqual(self.client.post(reverse('reset-password'), {**data, 'new_password': 'x' * 8}).status_code, 400)
+
+    def test_new_code_replaces_old_one(self):
+        old = issue_code(self.user, 'register')
+        new = issue_code(self.user, 'register')
+        if old != new:
+            self.assertFalse(verify_code(self.user, 'register', old))
+        self.assertTrue(verify_code(self.user, 'register', new.lower()))
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_attempts_are_limited(self):
+        code = issue_code(self.user, 'reset')
+        for _ in range(3):
+            self.assertFalse(verify_code(self.user, 'reset', '00000' if code != '00000' else '11111'))
+        self.assertFalse(verify_code(self.user, 'reset', code))  # revoked after the limit
+
+    def test_codes_expire(self):
+        code = issue_code(self.user, 'reset')
+        with mock.patch('time.time', return_value=time.time() + 601):
+            self.assertFalse(verify_code(self.user, 'reset', code))
+
+    @override_settings(OTP_DB_FALLBACK=True)
+    def test_database_fallback_survives_cache_loss(self):
+        code = issue_code(self.user, 'reset')
+        self.assertEqual(EmailVerification.objects.get().code, code)
+        otp_cache().clear()
+        self.assertTrue(verify_code(self.user, 'reset', code))
+        self.assertFalse(EmailVerification.objects.exists())
+
+    def test_purge_command(self):
+        stale = EmailVerification.objects.create(user=self.user, purpose='register')
+        EmailVerification.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(days=1))
+        EmailVerification.objects.create(user=self.user, purpose='reset')
+        call_command('purge_verification_codes', stdout=StringIO())
+        self.assertEqual(list(EmailVerification.objects.values_list('purpose', flat=True)), ['reset'])
+        call_command('purge_verification_codes', '--all', stdout=StringIO())
+        self.assertFalse(EmailVerification.objects.exists())
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        reset_throttles()
+        self.client = APIClient()
+        CustomUser.objects.create_user(email='dog@example.com', password='secret123', is_verified=True)
+
+    def login(self, email='dog@example.com', password='wrong', **extra):
+        return self.client.post(reverse('login'), {'email': email, 'password': password}, **extra)
+
+    @throttle_rates(login_email='2/min')
+    def test_denied_before_any_database_or_hashing_work(self):
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(self.login(email='DOG@example.com ').status_code, 400)
+        with self.assertNumQueries(0), mock.patch('users.serializers.authenticate') as authenticate:
+            response = self.login(password='secret123')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(response['Retry-After'], ('29', '30'))
+        authenticate.assert_not_called()
+        self.assertEqual(self.login(email='other@example.com').status_code, 400)  # other buckets unaffected
+
+    @throttle_rates(send_code_ip='2/min')
+    def test_per_ip_across_emails_and_views(self):
+        for email in ('a@example.com', 'b@example.com'):
+            self.client.post(reverse('resend-code'), {'email': email})
+        response = self.client.post(reverse('send-code'), {'email': 'c@example.com', 'purpose': 'register'})
+        self.assertEqual(response.status_code, 429)
+        other_ip = self.client.post(reverse('send-code'), {'email': 'c@example.com', 'purpose': 'register'},
+                                    REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(other_ip.status_code, 404)
+
+    @throttle_rates(verify_code_email='1/min')
+    def test_repeat_denials_are_answered_locally_and_counted(self):
+        data = {'email': 'dog@example.com', 'code': 'AAAAA', 'purpose': 'register'}
+        statuses = [self.client.post(reverse('verify-code'), data).status_code for _ in range(2)]
+        with mock.patch('users.throttling.throttle_cache') as throttle_cache:
+            shared = throttle_cache.return_value
+            shared.get.return_value = (10, time.time())
+            statuses.append(self.client.post(reverse('verify-code'), data).status_code)
+        self.assertEqual(statuses, [400, 429, 429])
+        self.assertEqual(shared.get.call_count, 1)  # the IP bucket only
+        self.assertEqual(throttle_stats()['verify_code_email'], {'allowed': 1, 'denied': 1, 'denied_locally': 1})
+
+    @throttle_rates(login_ip='2/min')
+    def test_forwarded_for_cannot_be_spoofed(self):
+        for spoofed in ('1.1.1.1', '2.2.2.2'):
+            self.login(HTTP_X_FORWARDED_FOR=f'{spoofed}, 203.0.113.7')
+        response = self.login(HTTP_X_FORWARDED_FOR='3.3.3.3, 203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.8').status_code, 400)
+
+    def test_concurrent_takes_share_the_bucket(self):
+        key, allowed = 'throttle:race', []
+
+        def take():
+            allowed.append(take_token(key, 5, 0.001)[0] == 0)
+
+        threads = [threading.Thread(target=take) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 5)
+
+    def test_bucket_refills_at_the_rate(self):
+        key = 'throttle:test'
+        self.assertEqual([take_token(key, 2, 1.0, now=100)[0] for _ in range(2)], [0, 0])
+        self.assertEqual(take_token(key, 2, 1.0, now=100.5), (0.5, False))
+        self.assertEqual(take_token(key, 2, 1.0, now=100.9)[1], True)
+        self.assertEqual(take_token(key, 2, 1.0, now=101.0), (0, False))
+
+
+@override_settings(PASSWORD_HASHERS=['users.tests.CountingHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'])
+class AuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='dog@example.com', password='secret123')
+        CountingHasher.calls = 0
+
+    def attempt(self, email, password):
+        CountingHasher.calls = 0
+        with CaptureQueriesContext(connection) as queries:
+            user = authenticate(email=email, password=password)
+        return user, CountingHasher.calls, len(queries)
+
+    def test_one_lookup_and_one_hash_per_attempt(self):
+        self.assertEqual(self.attempt('dog@example.com', 'secret123'), (self.user, 1, 1))
+        self.assertEqual(self.attempt('dog@example.com', 'wrong'), (None, 1, 1))
+        self.assertEqual(self.attempt('cat@example.com', 'secret123'), (None, 1, 1))
+
+    def test_unverified_users_are_told_to_verify(self):
+        self.user.is_active = False
+        self.user.save()
+        response = APIClient().post(reverse('login'), {'email': 'dog@example.com', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('verify your email', str(response.data))
+
+    def test_login_upgrades_outdated_hashes(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            password=make_password('secret123', hasher=MD5PasswordHasher()),
+        )
+        self.assertEqual(authenticate(email='dog@example.com', password='secret123'), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('counting_md5$'))
+
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command('benchmark_login', '--iterations', '3', stdout=stdout)
+        self.assertEqual(stdout.getvalue().count('p99'), 6)
+        self.assertFalse(CustomUser.objects.filter(email='benchmark@example.com').exists())
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        reset_throttles()
+        self.user = CustomUser.objects.create_user(
+            email='dog@example.com', password='secret123', is_verified=True, role='customer',
+        )
+        forget_token_version(self.user.pk)
+        response = APIClient().post(reverse('login'), {'email': 'dog@example.com', 'password': 'secret123'})
+        self.access = response.data['access']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_tokens_carry_the_claims(self):
+        claims = AccessToken(self.access)
+        self.assertEqual(
+            (claims['email'], claims['role'], claims['is_verified'], claims['ver']),
+            ('dog@example.com', 'customer', True, 0),
+        )
+        response = APIClient().post('/auth/jwt/create/', {'email': 'dog@example.com', 'password': 'secret123'})
+        self.assertEqual(AccessToken(response.data['access'])['ver'], 0)
+
+    def test_requests_skip_the_user_query(self):
+        url = reverse('product-list')
+        with mock.patch.object(ProductViewSet, 'authentication_classes', [JWTAuthentication]):
+            before = self.queries(url)
+        first = self.queries(url)  # reads token_version once
+        after = self.queries(url)
+        self.assertEqual((first, after), (before, before - 1))
+
+    def test_orders_work_with_a_claims_user(self):
+        product = Product.objects.create(
+            name='Kibble', description='', quantity=3, purchased_price='1.00', selling_price='2.00',
+            date_purchased='2025-01-01', supplier_name='Acme', main_category='Food', sub_category='Dry',
+            product_code='AD-SM-SH-CO-NO',
+        )
+        response = self.client.post(reverse('order-create'), {'items': [{'product': product.pk, 'quantity': 1}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().customer, self.user)
+        self.assertEqual(OutboxEmail.objects.get().recipients, ['dog@example.com'])
+
+    def test_password_reset_revokes_tokens(self):
+        url = reverse('product-list')
+        self.queries(url)
+        code = issue_code(self.user, 'reset')
+        APIClient().post(reverse('reset-password'), {
+            'email': 'dog@example.com', 'code': code, 'purpose': 'reset', 'new_password': 'better456',
+        })
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_row_loading_views_reject_revoked_tokens(self):
+        self.assertEqual(self.client.get(reverse('dog-profile')).status_code, 404)  # no profile yet
+        revoke_tokens(self.user)
+        self.assertEqual(self.client.get(reverse('dog-profile')).status_code, 401)
+        response = self.client.post(reverse('dog-profile-create'), {'name': 'Rex'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoked_refresh_tokens_cannot_be_refreshed(self):
+        refresh = str(tokens_for_user(self.user))
+        self.assertEqual(APIClient().post('/auth/jwt/refresh/', {'refresh': refresh}).status_code, 200)
+        revoke_tokens(self.user)
+        self.assertEqual(APIClient().post('/auth/jwt/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_deactivation_is_seen_after_the_cache_interval(self):
+        url = reverse('product-list')
+        self.queries(url)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        with mock.patch('users.authentication.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(self.client.get(reverse('product-list')).status_code, 200)
+        request = mock.Mock(META={'HTTP_AUTHORIZATION': f'Bearer {self.access}'})
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.email, user.is_staff), (self.user.pk, 'dog@example.com', False))
+
+
+class BootstrapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['throttle'].clear()
+        invalidate_catalog()
+        self.user = CustomUser.objects.create_user(email='dog@example.com', password='secret123', is_verified=True)
+        forget_token_version(self.user.pk)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+        for index, code in enumerate(['AD-SM-SH-CO-NO'] * 3 + ['PU-LA-LH-WS-BR']):
+            Product.objects.create(
+                name=f'Product {index}', description='', quantity=3, purchased_price='1.00',
+                selling_price='2.00', date_purchased='2025-01-01', supplier_name='Acme',
+                main_category='Food', sub_category='Dry', product_code=code,
+            )
+        self.url = reverse('bootstrap')
+
+    def make_profile(self):
+        return DogProfile.objects.create(
+            owner=self.user, name='Rex', gender='Male', life_stage='Adult', size='Small',
+            coat_type='Short-haired', role='Companion Dogs', health_considerations='None',
+        )
+
+    def test_without_a_dog_profile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['user'], {
+            'id': self.user.pk, 'email': 'dog@example.com', 'role': 'customer', 'is_verified': True,
+        })
+        self.assertIsNone(response.data['dog_profile'])
+        self.assertEqual(response.data['recommendations'], {'next': None, 'results': []})
+
+    def test_bundle_in_two_queries_with_one_etag(self):
+        self.make_profile()
+        get_catalog()
+        self.client.get(self.url)  # reads token_version
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['dog_profile']['name'], 'Rex')
+        self.assertEqual(len(response.data['recommendations']['results']), 3)
+
+        with mock.patch('users.views.BootstrapView.recommendation_limit', 2):
+            paged = self.client.get(self.url).data['recommendations']
+        self.assertEqual(len(paged['results']), 2)
+        self.assertTrue(paged['next'].startswith('http://testserver/api/inventory/recommendations/?cursor='))
+        self.assertIn('limit=2', paged['next'])
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        DogProfile.objects.filter(owner=self.user).update(name='Max')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DogProfileCodeTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='dog@example.com', password='secret123', is_verified=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upsert(self, **values):
+        data = dict(name='Rex', life_stage='Adult', size='Small', coat_type='Short-haired', role='Companion Dogs',
+                    health_considerations='None')
+        data.update(values)
+        return self.client.post(reverse('dog-profile-create'), data, format='json')
+
+    def masks(self):
+        return DogProfile.objects.filter(owner=self.user).values_list(*CODE_MASK_FIELDS).get()
+
+    def test_writes_store_normalized_masks(self):
+        self.assertEqual(self.upsert(life_stage=' adult ', health_considerations='allergies and sensitivities, ').status_code, 200)
+        profile = DogProfile.objects.get(owner=self.user)
+        self.assertEqual(profile.life_stage, 'adult')
+        self.assertEqual(profile.health_considerations, 'allergies and sensitivities')
+        self.assertEqual(stored_profile_codes(profile), ('AD', 'SM', 'SH', 'CO', ['AS']))
+
+        response = self.client.patch(reverse('dog-profile'), {
+            'size': 'Giant', 'lifestyle': 'Working / Service Dogs',
+            'health_considerations': 'Brachycephalic (Short-nosed), Joint and Mobility Issues',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stored_profile_codes(DogProfile.objects.get(owner=self.user)),
+                         ('AD', 'GI', 'SH', 'WS', ['BR', 'JM']))
+
+    def test_unknown_values_are_rejected(self):
+        response = self.upsert(size='Huge', health_considerations='None, Fleas')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'size', 'health_considerations'})
+        self.assertFalse(DogProfile.objects.exists())
+
+        self.upsert()
+        before = self.masks()
+        for values in ({'life_stage': 'Small'}, {'lifestyle': 'Couch'}, {'health_considerations': 'Diabetes'}):
+            self.assertEqual(self.client.patch(reverse('dog-profile'), values, format='json').status_code, 400)
+        self.assertEqual(self.masks(), before)
+
+    def test_non_string_values_are_rejected(self):
+        self.upsert()
+        before = self.masks()
+        for value in (None, 3, ['None']):
+            response = self.upsert(health_considerations=value)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(set(response.data), {'health_considerations'})
+        self.assertEqual(self.masks(), before)
+
+    def test_migration_backfills_existing_profiles(self):
+        profile = DogProfile.objects.create(
+            owner=self.user, name='Rex', gender='Male', life_stage='Senior', size='Medium', coat_type='Curly',
+            role='Companion Dogs', health_considerations='Joint and Mobility Issues, None',
+        )
+        DogProfile.objects.update(**dict.fromkeys(CODE_MASK_FIELDS, 0))
+        backfill = import_module('users.migrations.0006_backfill_dogprofile_code_masks').backfill_code_masks
+        backfill(django_apps, None)
+        profile.refresh_from_db()
+        self.assertEqual(stored_profile_codes(profile), ('SE', 'ME', '', 'CO', ['NO', 'JM']))
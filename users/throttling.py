@@ -0,0 +1,169 @@
+"""Token-bucket throttles for the unauthenticated auth and OTP endpoints.
+
+A bucket holds up to N tokens and refills at N per period, from a DRF-style
+rate such as '5/min': bursts up to N are allowed, then one request per
+period/N. Buckets live in the 'throttle' cache alias, so every worker sees
+the same balance when that cache is shared; a short lock key taken with
+cache.add() makes each read-modify-write of a bucket atomic. A worker that
+finds a bucket empty also remembers locally until when it stays empty, and
+answers repeat offenders without a cache round-trip.
+
+Clients are identified by DRF's get_ident(), which trusts the last
+NUM_PROXIES entries of X-Forwarded-For only.
+
+The throttles run in APIView.initial(), before the handler parses
+credentials, hashes a password, queries a user or queues an email. A denial
+is a 429 with Retry-After. Decisions are counted per process (see
+throttle_stats()).
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+KEY = 'throttle:{scope}:{ident}'
+LOCK_KEY = '{key}:lock'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_lock = threading.Lock()
+_empty_until = {}  # bucket key -> time before which the bucket is known to be empty
+_decisions = Counter()
+
+# Stale fast-path entries are dropped once the map grows past this
+MAX_LOCAL_ENTRIES = 10000
+
+# A bucket lock is held for one get and set; it expires on its own should its holder die
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_RETRY_DELAY = 0.005
+
+
+def throttle_cache():
+    return caches['throttle']
+
+
+def _acquire(cache, lock_key):
+    for attempt in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            return True
+        time.sleep(LOCK_RETRY_DELAY)
+    return False
+
+
+def take_token(key, capacity, per_second, now=None):
+    """Takes one token from the bucket.
+
+    Returns (wait, local): wait is 0 if allowed, else the seconds until a
+    token is due; local is True if the local fast path answered.
+    """
+    now = time.time() if now is None else now
+    with _lock:
+        if _empty_until.get(key, 0) > now:
+            return _empty_until[key] - now, True
+
+    cache, lock_key = throttle_cache(), LOCK_KEY.format(key=key)
+    if not _acquire(cache, lock_key):
+        return LOCK_TIMEOUT, False  # the same client is racing itself; deny rather than wait
+    try:
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * per_second)
+        if tokens >= 1:
+            # Kept until the bucket would be full again; a missing bucket is a full one
+            cache.set(key, (tokens - 1, now), timeout=int((capacity - tokens + 1) / per_second) + 1)
+            return 0, False
+    finally:
+        cache.delete(lock_key)
+
+    wait = (1 - tokens) / per_second
+    with _lock:
+        if len(_empty_until) > MAX_LOCAL_ENTRIES:
+            for stale in [k for k, until in _empty_until.items() if until <= now]:
+                del _empty_until[stale]
+        _empty_until[key] = now + wait
+    return wait, False
+
+
+def parse_rate(rate):
+    """'5/min' -> (capacity 5, 5 / 60 tokens per second)."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+def throttle_stats():
+    """Decisions of this process: {'<scope>': {'allowed', 'denied', 'denied_locally'}}."""
+    with _lock:
+        decisions = dict(_decisions)
+    stats = {}
+    for (scope, outcome), count in sorted(decisions.items()):
+        stats.setdefault(scope, {'allowed': 0, 'denied': 0, 'denied_locally': 0})[outcome] = count
+    return stats
+
+
+def reset_throttles():
+    with _lock:
+        _empty_until.clear()
+        _decisions.clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttles by get_ident() under ``scope``; the rate is DEFAULT_THROTTLE_RATES[scope]."""
+    scope = None
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_bucket_ident(self, request, view):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        ident = self.get_bucket_ident(request, view)
+        if rate is None or ident is None:
+            return True
+        ident = hashlib.md5(ident.encode(), usedforsecurity=False).hexdigest()  # cache-key safe
+        self.wait_seconds, locally = take_token(KEY.format(scope=self.scope, ident=ident), *parse_rate(rate))
+        outcome = 'allowed' if not self.wait_seconds else 'denied_locally' if locally else 'denied'
+        with _lock:
+            _decisions[self.scope, outcome] += 1
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class EmailBucketThrottle(TokenBucketThrottle):
+    """Throttles by the (case-folded) email in the request body; no email, no limit."""
+
+    def get_bucket_ident(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return email.strip().casefold()
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    scope = 'login_ip'
+
+
+class LoginEmailThrottle(EmailBucketThrottle):
+    scope = 'login_email'
+
+
+class SendCodeIPThrottle(TokenBucketThrottle):
+    scope = 'send_code_ip'
+
+
+class SendCodeEmailThrottle(EmailBucketThrottle):
+    scope = 'send_code_email'
+
+
+class VerifyCodeIPThrottle(TokenBucketThrottle):
+    scope = 'verify_code_ip'
+
+
+class VerifyCodeEmailThrottle(EmailBucketThrottle):
+    scope = 'verify_code_email'
@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
     path('login/', views.LoginView.as_view(), name='login'),
+    path('bootstrap/', views.BootstrapView.as_view(), name='bootstrap'),
 
     path('send-code/', views.SendVerificationCodeView.as_view(), name='send-code'),
     path('verify-code/', views.VerifyCodeView.as_view(), name='verify-code'),
@@ -14,6 +15,7 @@ urlpatterns = [
 
     path('create-superuser/', views.create_superuser_view),
     path('list/', views.list_users),
+    path('throttle-stats/', views.throttle_decisions, name='throttle-stats'),
     path('delete/<int:user_id>/', views.delete_user),
     path('dog-profile/exists/', views.dog_profile_exists),
     path('dog-profile/create/', views.upsert_dog_profile, name='dog-profile-create'),
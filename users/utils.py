@@ -1,20 +1,19 @@
-import random
+import secrets
 import string
-from django.core.mail import send_mail
+from .outbox import enqueue_mail
 
 def generate_code():
     """Generates a 5-character alphanumeric code for verification."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
+    return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(5))
 
 def send_verification_email(email, code, purpose='registration'):
-    """Sends a verification email with the generated code."""
+    """Queues a verification email with the generated code (see users.outbox)."""
     subject = 'CanineRacks Verification Code'
     message = f'Your code is: {code}\n\nUse this code to complete your {purpose} process.'
     
-    send_mail(
+    enqueue_mail(
         subject=subject,
         message=message,
         from_email='canineracks@gmail.com',  # ✅ Replace with your new Gmail
         recipient_list=[email],
-        fail_silently=False,
     )
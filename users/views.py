@@ -2,23 +2,36 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from rest_framework.utils.urls import replace_query_param
 
-from .models import EmailVerification, DogProfile, CustomUser
+from inventory.codes import PROFILE_FIELD_CODES, clean_profile_value, stored_profile_codes
+from inventory.conditional import make_etag, not_modified, set_validators
+from inventory.recommendations import profile_signature
+from inventory.serializers import ProductSerializer
+from inventory.views import ranked_recommendations
+
+from .models import DogProfile, CustomUser
 from .serializers import (
     UserCreateSerializer, LoginSerializer,
     EmailVerificationSerializer, VerifyCodeSerializer,
     ResetPasswordWithCodeSerializer, DogProfileSerializer
 )
-from .utils import send_verification_email, generate_code
+from .authentication import ClaimsJWTAuthentication, revoke_tokens, tokens_for_user
+from .otp import issue_code, verify_code
+from .throttling import (
+    LoginEmailThrottle, LoginIPThrottle, SendCodeEmailThrottle, SendCodeIPThrottle,
+    VerifyCodeEmailThrottle, VerifyCodeIPThrottle, throttle_stats,
+)
+from .utils import send_verification_email
 from rest_framework.generics import ListAPIView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.exceptions import PermissionDenied, NotFound
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 
 User = get_user_model()
 
@@ -33,12 +46,13 @@ class RegisterView(generics.CreateAPIView):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @transaction.atomic
     def perform_create(self, serializer):
         user = serializer.save()  # 👈 Let serializer handle creation and role detection
 
-        # Send verification code after successful user creation
-        code = EmailVerification.objects.create(user=user, purpose='register')
-        send_verification_email(user.email, code.code, purpose='register')
+        # Queue the verification code with the new user, in the same transaction
+        code = issue_code(user, 'register')
+        send_verification_email(user.email, code, purpose='register')
 
 
   
@@ -49,13 +63,15 @@ class RegisterView(generics.CreateAPIView):
 class LoginView(generics.GenericAPIView):
     serializer_class = LoginSerializer
     permission_classes = [AllowAny]
+    authentication_classes = []  # a stray bearer token must not cost a user query
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
 
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -73,6 +89,8 @@ class LoginView(generics.GenericAPIView):
 class SendVerificationCodeView(generics.GenericAPIView):
     serializer_class = EmailVerificationSerializer
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [SendCodeIPThrottle, SendCodeEmailThrottle]
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -82,20 +100,21 @@ class SendVerificationCodeView(generics.GenericAPIView):
         purpose = serializer.validated_data['purpose']
 
         user = get_object_or_404(User, email=email)
-        EmailVerification.objects.filter(user=user, purpose=purpose).delete()
+        with transaction.atomic():
+            code = issue_code(user, purpose)
+            print(f"✅ Issued code with purpose '{purpose}' for {email}")
 
-        code = EmailVerification.objects.create(user=user, purpose=purpose)
-        print(f"✅ Stored code {code.code} with purpose '{purpose}' for {email}")
-
-        send_verification_email(user.email, code.code, purpose=purpose)
+            send_verification_email(user.email, code, purpose=purpose)
         return Response({'message': f'Verification code sent to {email}'})
 
 # =============================
-# Verify Code View (no expiration check)
+# Verify Code View
 # =============================
 class VerifyCodeView(generics.GenericAPIView):
     serializer_class = VerifyCodeSerializer
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [VerifyCodeIPThrottle, VerifyCodeEmailThrottle]
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -107,20 +126,14 @@ class VerifyCodeView(generics.GenericAPIView):
 
         user = get_object_or_404(User, email=email)
 
-        match = EmailVerification.objects.filter(
-            user=user,
-            code=code,
-            purpose=purpose
-        ).first()
-
-        if not match:
+        # A reset code stays valid for ResetPasswordWithCodeView
+        if not verify_code(user, purpose, code, consume=purpose == 'register'):
             return Response({'error': 'Invalid or expired code.'}, status=400)
 
         if purpose == 'register':
             user.is_verified = True
             user.is_active = True
             user.save()
-            match.delete()
 
         return Response({'message': 'Verification successful.'})
 
@@ -142,20 +155,13 @@ class ResetPasswordWithCodeView(generics.GenericAPIView):
         new_password = serializer.validated_data['new_password']
 
         user = get_object_or_404(User, email=email)
-        match = EmailVerification.objects.filter(
-            user=user,
-            code=code,
-            purpose='reset'
-        ).first()
-
-        if not match:
+        if not verify_code(user, 'reset', code):
             print("❌ No matching verification code found.")
             return Response({'error': 'Invalid or expired code.'}, status=status.HTTP_400_BAD_REQUEST)
 
         user.set_password(new_password)
         user.save()
-        match.delete()
-        print("📄 Available reset codes:", EmailVerification.objects.filter(user=user, purpose='reset').values())
+        revoke_tokens(user)  # sessions signed in with the old password end
 
         return Response({'message': 'Password has been reset successfully.'})
 
@@ -180,6 +186,50 @@ class DogProfileView(generics.RetrieveUpdateAPIView):
 
         return profile
 
+# =============================
+# App Launch Bundle
+# =============================
+class BootstrapView(APIView):
+    """User info, dog profile (or null) and the first page of ranked recommendations.
+
+    Replaces the dog-profile/exists/, dog-profile/ and recommendations/ calls
+    made at launch. Costs two queries once warm: the profile and the page of
+    products. One ETag covers the whole bundle.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [ClaimsJWTAuthentication]
+    recommendation_limit = 20
+
+    def get(self, request):
+        user = request.user
+        profile = DogProfile.objects.filter(owner_id=user.pk).first()
+        dog_profile = DogProfileSerializer(profile).data if profile else None
+        signature = profile_signature(stored_profile_codes(profile)) if profile else None
+        page, cursor = ranked_recommendations(signature, self.recommendation_limit)
+
+        user_info = {'id': user.pk, 'email': user.email, 'role': user.role, 'is_verified': user.is_verified}
+        etag = make_etag(request, user_info, dog_profile, [(p.pk, p.updated_at) for p, _ in page], cursor)
+        response = not_modified(request, etag, None)
+        if response is not None:
+            return response
+
+        results = []
+        for product, score in page:
+            item = ProductSerializer(product, context={'request': request}).data
+            item['score'] = score
+            results.append(item)
+        next_url = None
+        if cursor:
+            next_url = request.build_absolute_uri(reverse('product-recommendations'))
+            next_url = replace_query_param(next_url, 'limit', self.recommendation_limit)
+            next_url = replace_query_param(next_url, 'cursor', cursor)
+
+        return set_validators(Response({
+            'user': user_info,
+            'dog_profile': dog_profile,
+            'recommendations': {'next': next_url, 'results': results},
+        }), etag, None)
+
 # =============================
 # Dog Profile Create View (New Users)
 # =============================
@@ -191,16 +241,29 @@ def upsert_dog_profile(request):
         raise PermissionDenied("Only customers can manage dog profiles.")
     
     data = request.data
+    values, errors = {}, {}
+    for field in PROFILE_FIELD_CODES:
+        if field in data:
+            if not isinstance(data[field], str):
+                errors[field] = ["Must be a string."]
+                continue
+            try:
+                values[field] = clean_profile_value(field, data[field])
+            except ValueError as exc:
+                errors[field] = [str(exc)]
+    if errors:
+        raise ValidationError(errors)
+
     profile, created = DogProfile.objects.get_or_create(owner=user)
 
     profile.name = data.get('name', profile.name)
     profile.breed = data.get('breed', profile.breed)
-    profile.life_stage = data.get('life_stage', profile.life_stage)
-    profile.size = data.get('size', profile.size)
-    profile.coat_type = data.get('coat_type', profile.coat_type)
-    profile.role = data.get('role', profile.role)
-    profile.health_considerations = data.get('health_considerations', profile.health_considerations)
-    profile.save()
+    profile.life_stage = values.get('life_stage', profile.life_stage)
+    profile.size = values.get('size', profile.size)
+    profile.coat_type = values.get('coat_type', profile.coat_type)
+    profile.role = values.get('role', profile.role)
+    profile.health_considerations = values.get('health_considerations', profile.health_considerations)
+    profile.save()  # compiles the code masks
 
     return Response({'message': 'Dog profile saved.'}, status=status.HTTP_200_OK)
 
@@ -210,6 +273,8 @@ def upsert_dog_profile(request):
 # =============================
 class ResendVerificationCodeView(APIView):
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [SendCodeIPThrottle, SendCodeEmailThrottle]
 
     def post(self, request):
         email = request.data.get('email')
@@ -223,9 +288,9 @@ class ResendVerificationCodeView(APIView):
             if user.is_verified and purpose == 'register':
                 return Response({'message': 'Email is already verified.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            code = generate_code()
-            EmailVerification.objects.create(user=user, code=code, purpose=purpose)
-            send_verification_email(email, code, purpose=purpose)
+            with transaction.atomic():
+                code = issue_code(user, purpose)
+                send_verification_email(email, code, purpose=purpose)
 
             return Response({'message': 'Verification code resent successfully.'}, status=status.HTTP_200_OK)
 
@@ -241,6 +306,14 @@ def list_users(request):
     users = User.objects.all().values('id', 'email', 'role', 'is_active')
     return Response(list(users))
 
+# =============================
+# Admin Only: Throttle Decisions (this process)
+# =============================
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def throttle_decisions(request):
+    return Response(throttle_stats())
+
 # =============================
 # Admin Only: Delete User
 # =============================